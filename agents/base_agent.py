@@ -1,9 +1,82 @@
 # agents/base_agent.py
 import asyncio
+import hashlib
+import json
+import os
+import pickle
+import re
 from utils.api_utils import ApiManager
+from utils.cache_backend import get_cache_backend
+from utils.llm_batcher import get_llm_batcher
+from utils.semantic_cache import get_semantic_cache
 from typing import Optional, Dict, Any
 import httpx
 
+# 进程级的精确匹配响应缓存：相同的 (model, temperature, messages) 组合
+# 直接复用之前的结果，省去一次完整的 LLM 往返（秒级 -> 毫秒级）。
+_RESPONSE_CACHE: Dict[str, str] = {}
+_RESPONSE_CACHE_MAX_SIZE = 1024
+_RESPONSE_CACHE_PATH = os.path.join("results", "response_cache.pkl")
+_RESPONSE_CACHE_PERSIST_EVERY = 32
+_response_cache_lock = asyncio.Lock()
+_response_cache_loaded = False
+_response_cache_dirty_writes = 0
+
+
+def _load_response_cache_once() -> None:
+    """首次使用时从磁盘恢复上次运行留下的缓存（进化循环常重放相同prompt）"""
+    global _response_cache_loaded
+    if _response_cache_loaded:
+        return
+    _response_cache_loaded = True
+    try:
+        with open(_RESPONSE_CACHE_PATH, "rb") as f:
+            _RESPONSE_CACHE.update(pickle.load(f))
+    except (OSError, pickle.PickleError, EOFError):
+        pass
+
+
+def _persist_response_cache() -> None:
+    """把缓存落盘；失败时静默跳过，缓存只是加速手段"""
+    try:
+        os.makedirs(os.path.dirname(_RESPONSE_CACHE_PATH), exist_ok=True)
+        with open(_RESPONSE_CACHE_PATH, "wb") as f:
+            pickle.dump(_RESPONSE_CACHE, f)
+    except OSError:
+        pass
+
+# 正在进行中的请求（single-flight）：两个并发的相同请求只发一次API调用，
+# 后到的调用方直接等待先到者的Future。
+_INFLIGHT: Dict[str, asyncio.Future] = {}
+
+
+# 错误消息按异常类型查表分发：单个except处理器取代逐一匹配的try/except阶梯
+_ERROR_FORMATTERS = {
+    httpx.TimeoutException: lambda e: f"Error: Request timed out. Details: {e}",
+    httpx.HTTPStatusError: lambda e: f"Error: API connection error. Status code {e.response.status_code}. Details: {e}",
+}
+
+
+def _format_agent_error(e: Exception) -> str:
+    """根据异常类型格式化错误消息，未知类型走通用格式"""
+    formatter = _ERROR_FORMATTERS.get(type(e))
+    if formatter is None:
+        # 精确类型未命中时按isinstance匹配子类（如 httpx.ConnectTimeout）
+        for exc_type, fmt in _ERROR_FORMATTERS.items():
+            if isinstance(e, exc_type):
+                formatter = fmt
+                break
+    if formatter is not None:
+        return formatter(e)
+    return f"Error: An unexpected error occurred. Details: {type(e).__name__} - {e}"
+
+
+def _make_cache_key(model: Any, temperature: Any, messages: Any) -> str:
+    """根据请求的全部决定性因素计算缓存键"""
+    payload = json.dumps([model, temperature, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8")).hexdigest()
+
+
 class Agent:
     """基础Agent类，所有Agent的基类"""
 
@@ -15,28 +88,146 @@ class Agent:
         self.role = None
         self.type = None
 
-    async def generate(self, prompt: str) -> str:
+    def _response_cache_enabled(self) -> bool:
+        """判断是否启用响应缓存。默认仅在确定性采样 (temperature == 0) 时启用，可通过配置强制开关。"""
+        enabled = self.config.get("response_cache_enabled")
+        if enabled is not None:
+            return bool(enabled)
+        # 默认只在近似确定性的采样温度下缓存，高温下的重复响应没有代表性
+        temperature = self.config.get("temperature")
+        return temperature is not None and temperature <= 0.2
+
+    def _stream_stop_pattern(self):
+        """
+        配置了 stream_stop_regex 时返回编译好的模式：生成走流式接口，
+        标记（如最终答案的 \\boxed{...}）一出现就中止，省掉其后的解码token。
+        """
+        pattern = self.config.get("stream_stop_regex")
+        if not pattern:
+            return None
+        cached = getattr(self, "_compiled_stop_pattern", None)
+        if cached is None or cached.pattern != pattern:
+            cached = re.compile(pattern, re.DOTALL)
+            self._compiled_stop_pattern = cached
+        return cached
+
+    async def _generate_raw(self, messages: list) -> str:
+        """
+        发出底层的LLM调用，带single-flight去重：
+        两个并发的相同请求只触发一次API往返，后到者等待先到者的结果。
+        """
+        dedup_key = None
+        if self.config.get("inflight_dedup_enabled", True):
+            dedup_key = _make_cache_key(
+                self.config.get("default_model"),
+                self.config.get("temperature"),
+                messages
+            )
+            existing = _INFLIGHT.get(dedup_key)
+            if existing is not None:
+                return await existing
+
+        future = None
+        if dedup_key is not None:
+            future = asyncio.get_event_loop().create_future()
+            _INFLIGHT[dedup_key] = future
+
+        try:
+            stop_pattern = self._stream_stop_pattern()
+            # 配置了提前终止标记时走流式接口，标记出现即中止生成
+            if stop_pattern is not None:
+                raw_response = await self.api_manager.generate_chat_completion_stream(
+                    messages, stop_regex=stop_pattern)
+            # 启用合并器时，请求先被短暂缓冲，和其他并发Agent的请求攒成一批发出
+            elif self.config.get("llm_batcher_enabled", False):
+                raw_response = await get_llm_batcher().submit(
+                    lambda: self.api_manager.generate_chat_completion(messages))
+            else:
+                raw_response = await self.api_manager.generate_chat_completion(messages)
+            if future is not None:
+                future.set_result(raw_response)
+            return raw_response
+        except BaseException as e:
+            if future is not None:
+                # CancelledError是BaseException：发起方被取消时也必须了结Future，
+                # 否则finally弹出键后，已在等待的后到者会永远挂在这个Future上
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # 标记异常已被取回，避免没有等待者时的告警
+                    future.exception()
+            raise
+        finally:
+            if dedup_key is not None:
+                _INFLIGHT.pop(dedup_key, None)
+
+    async def generate(self, prompt: str, cacheable_prefix: Optional[str] = None) -> str:
         """
         生成纯文本响应。所有自我评估逻辑已被移除。
+        cacheable_prefix 用于传入大段静态上下文（如待改进的模板正文），
+        它会并入system消息，和system_prompt一起构成稳定前缀。
         """
+        # system_prompt 始终作为第一条消息，保证跨调用有稳定不变的前缀，
+        # 让服务商的 prompt 前缀缓存（KV cache）可以命中。
+        system_content = self.system_prompt
+        if cacheable_prefix:
+            system_content = f"{self.system_prompt}\n\n{cacheable_prefix}"
         messages = [
-            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": system_content},
             {"role": "user", "content": prompt}
         ]
+        if self.config.get("prompt_cache_control", False):
+            # 对支持 Anthropic 风格 cache_control 的端点，显式标记静态前缀可缓存
+            messages[0]["cache_control"] = {"type": "ephemeral"}
+
+        cache_key = None
+        if self._response_cache_enabled():
+            cache_key = _make_cache_key(
+                self.config.get("default_model"),
+                self.config.get("temperature"),
+                messages
+            )
+            async with _response_cache_lock:
+                _load_response_cache_once()
+                if cache_key in _RESPONSE_CACHE:
+                    return _RESPONSE_CACHE[cache_key]
+
+            # L2：跨进程的Redis缓存，多worker部署时共享命中
+            remote = await get_cache_backend(self.config).get(cache_key)
+            if remote is not None:
+                async with _response_cache_lock:
+                    _RESPONSE_CACHE[cache_key] = remote
+                return remote
+
+        # 语义缓存：精确哈希未命中时，尝试按嵌入相似度复用近似重复prompt的响应
+        semantic_cache = get_semantic_cache(self.config)
+        if semantic_cache.enabled:
+            cached = semantic_cache.lookup(prompt)
+            if cached is not None:
+                return cached
 
         try:
-            raw_response = await self.api_manager.generate_chat_completion(messages)
-            return raw_response.strip()
+            raw_response = await self._generate_raw(messages)
+            response = raw_response.strip()
+
+            if cache_key is not None:
+                global _response_cache_dirty_writes
+                async with _response_cache_lock:
+                    # 简单的 FIFO 淘汰，避免缓存无限增长
+                    while len(_RESPONSE_CACHE) >= _RESPONSE_CACHE_MAX_SIZE:
+                        _RESPONSE_CACHE.pop(next(iter(_RESPONSE_CACHE)))
+                    _RESPONSE_CACHE[cache_key] = response
+                    _response_cache_dirty_writes += 1
+                    if _response_cache_dirty_writes >= _RESPONSE_CACHE_PERSIST_EVERY:
+                        _response_cache_dirty_writes = 0
+                        _persist_response_cache()
+                await get_cache_backend(self.config).setex(cache_key, response)
+
+            semantic_cache.store(prompt, response)
+            return response
 
-        except httpx.TimeoutException as e:
-            error_message = f"Error: Request timed out. Details: {e}"
-            print(f"AGENT ERROR ({self.name}): {error_message}")
-            return error_message
-        except httpx.HTTPStatusError as e:
-            error_message = f"Error: API connection error. Status code {e.response.status_code}. Details: {e}"
-            print(f"AGENT ERROR ({self.name}): {error_message}")
-            return error_message
         except Exception as e:
-            error_message = f"Error: An unexpected error occurred. Details: {type(e).__name__} - {e}"
+            error_message = _format_agent_error(e)
             print(f"AGENT ERROR ({self.name}): {error_message}")
             return error_message
\ No newline at end of file
@@ -1,16 +1,21 @@
 # core/agent_factory.py
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional
 import os
 # from mcp_agent.agents.agent import Agent
-from utils.prompt_utils import load_prompt_template
+from utils.prompt_utils import render_prompt
 import json
 from agents.base_agent import Agent
 from agents.specialized.code_agent import CodeAgent
 from agents.specialized.review_agent import ReviewAgent
 from agents.specialized.test_agent import TestAgent
-from utils.json_utils import extract_and_parse_json
+from utils.json_utils import dump_json, extract_and_parse_json
 from agents.specialized.math_agent import MathAgent
 
+# 模块级的模板文件缓存，键为 (路径, mtime_ns)。
+# 工厂可能随每个请求实例化，避免每次都重新stat+读取+解析同一文件。
+_TEMPLATE_CACHE: Dict[tuple, Dict[str, Any]] = {}
+
 
 class AgentFactory:
     """
@@ -20,14 +25,28 @@ class AgentFactory:
         """初始化Agent工厂"""
         self.config = config
         self.agent_templates = {}
+        # 每种类型的模板序列化结果缓存，save_agent_template 时失效
+        self._template_json_cache: Dict[str, str] = {}
+        # 模板落盘采用防抖的后台写：短时间内的多次保存合并成一次磁盘写入
+        self._templates_dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_debounce_seconds = 0.05
         self._load_templates()
 
     def _load_templates(self) -> None:
         """加载Agent模板"""
         templates_path = os.path.join("config", "agent_templates.json")
         if os.path.exists(templates_path):
-            with open(templates_path, "r", encoding="utf-8") as f:
-                self.agent_templates = json.load(f)
+            # 以 (路径, mtime) 为键缓存解析结果；文件被修改时mtime变化，缓存自然失效
+            cache_key = (templates_path, os.stat(templates_path).st_mtime_ns)
+            cached = _TEMPLATE_CACHE.get(cache_key)
+            if cached is None:
+                with open(templates_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                _TEMPLATE_CACHE.clear()
+                _TEMPLATE_CACHE[cache_key] = cached
+            # 返回副本，进化机制修改模板时不会污染缓存
+            self.agent_templates = dict(cached)
         else:
             # 默认模板
             self.agent_templates = {
@@ -119,7 +138,8 @@ class AgentFactory:
             config = self.config
         )
 
-        prompt = load_prompt_template("generate_agent_spec").format(
+        prompt = render_prompt(
+            "generate_agent_spec",
             task_description=task_description,
             agent_type=agent_type,
         )
@@ -149,13 +169,52 @@ class AgentFactory:
             "custom_prompt": f"You are a specialized {agent_type} agent created specifically for handling tasks related to: {task_description}"
         }
 
+    def get_template_json(self, agent_type: str) -> str:
+        """
+        返回该类型当前模板的序列化JSON。
+        结果按类型记忆化，避免并行进化时对同一模板重复序列化；
+        save_agent_template 会使对应条目失效。
+        """
+        cached = self._template_json_cache.get(agent_type)
+        if cached is None:
+            template = self.agent_templates.get(agent_type, {
+                "system_prompt": f"You are a helpful {agent_type} assistant."
+            })
+            cached = dump_json(template)
+            self._template_json_cache[agent_type] = cached
+        return cached
+
     async def save_agent_template(self, agent_type: str, template: Dict[str, Any]) -> None:
-        """保存新的Agent模板"""
+        """保存新的Agent模板（内存立即生效，磁盘写入防抖合并到后台）"""
         self.agent_templates[agent_type] = template
-
-        # 保存到文件
+        self._template_json_cache.pop(agent_type, None)
+
+        # 只标记脏位并调度一次延迟落盘；进化循环无需阻塞在磁盘I/O上
+        self._templates_dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_templates_later())
+
+    async def _flush_templates_later(self) -> None:
+        """防抖窗口结束后，把内存中的模板一次性写到磁盘"""
+        await asyncio.sleep(self._flush_debounce_seconds)
+        while self._templates_dirty:
+            self._templates_dirty = False
+            await asyncio.to_thread(self._write_templates_to_disk)
+
+    def _write_templates_to_disk(self) -> None:
+        """同步写盘：写临时文件后原子替换，避免读到半成品文件"""
         templates_path = os.path.join("config", "agent_templates.json")
         os.makedirs(os.path.dirname(templates_path), exist_ok=True)
 
-        with open(templates_path, "w", encoding="utf-8") as f:
+        tmp_path = templates_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(self.agent_templates, f, indent=2)
+        os.replace(tmp_path, templates_path)
+
+    async def flush_templates(self) -> None:
+        """强制完成所有待落盘的模板写入（进程退出前调用）"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._templates_dirty:
+            self._templates_dirty = False
+            await asyncio.to_thread(self._write_templates_to_disk)
@@ -1,5 +1,7 @@
 # core/collaboration.py
-from typing import List, Dict, Any
+import asyncio
+import re
+from typing import List, Dict, Any, Set
 from agents.base_agent import Agent
 
 
@@ -8,66 +10,127 @@ class CollaborationManager():
     管理Agent协作。
     不要搞所有基于置信度的修正循环。
     """
+
+    # 用于识别 input 中对特定步骤的显式引用，例如 "step_2" / "step 2"
+    _STEP_REF_RE = re.compile(r"step[_\s]*(\d+)", re.IGNORECASE)
+
+    # Prompt的常量片段在类作用域上只构建一次，调用处用一次join拼接，
+    # 省去每个步骤重复的模板解析与常量文本分配
+    _EMPTY_HISTORY_BLOCK = "This is the first step. There is no history yet.\n\n"
+    _PROMPT_TAIL = (
+        "Based on the original task and the full collaboration history, "
+        "please perform your action. Provide a clear, comprehensive response."
+    )
+
+    def _resolve_dependencies(self, plan_steps: List[Dict[str, Any]]) -> List[Set[int]]:
+        """
+        解析每个步骤的依赖集合。
+        计划中的步骤实际构成一个DAG而非链条：
+        - input 为 "task_description" 的步骤不依赖任何前序输出；
+        - input 显式引用 "step_N" 的步骤仅依赖第N步；
+        - 其余情况（如 "previous_output"）默认依赖前一步。
+        """
+        dependencies: List[Set[int]] = []
+        for i, step in enumerate(plan_steps):
+            input_source = str(step.get("input", "previous_output"))
+            ref = self._STEP_REF_RE.search(input_source)
+            if input_source == "task_description":
+                deps: Set[int] = set()
+            elif ref and 0 <= int(ref.group(1)) - 1 < i:
+                deps = {int(ref.group(1)) - 1}
+            elif i > 0:
+                deps = {i - 1}
+            else:
+                deps = set()
+            dependencies.append(deps)
+        return dependencies
+
     async def execute_plan(self,
                            plan: Dict[str, Any],
                            agents: List[Agent],
                            task_description: str) -> Dict[str, Any]:
-        context = {
-            "task_description": task_description,
-            "agents": {agent.name: agent for agent in agents}
-        }
+        # Agent按名字建一次索引即可，不放进context，返回路径也无需再过滤
+        agent_map = {agent.name: agent for agent in agents}
 
         final_result = {"output": None, "steps": [], "context": {}}
-        collaboration_history = ""
+        # 历史以分块列表累积，仅在构建prompt时join一次，
+        # 避免随计划变长而出现 O(N^2) 的字符串拷贝
+        history_parts: List[str] = []
         last_output = "No steps were executed."
         plan_steps = plan.get("steps", [])
 
-        for i, step in enumerate(plan_steps):
-            agent_name = step["agent"]
-            action = step["action"]
-
-            print(f"\n--- [Collaboration] Executing Step {i + 1} ---")
-            print(f"  Agent: {agent_name}")
-            print(f"  Action: {action}")
-
-            agent = context["agents"].get(agent_name)
-            if not agent:
-                raise ValueError(f"Agent '{agent_name}' not found")
-
-            prompt = self._format_prompt_with_history(
-                task_description,
-                collaboration_history,
-                agent,
-                action
+        # 按依赖关系把步骤分成若干"波"：同一波内的步骤互相独立，可并发执行，
+        # 总耗时从所有步骤之和收敛到关键路径长度。
+        dependencies = self._resolve_dependencies(plan_steps)
+        levels: List[int] = []
+        for i, deps in enumerate(dependencies):
+            levels.append(0 if not deps else max(levels[j] for j in deps) + 1)
+
+        step_outputs: Dict[int, str] = {}
+
+        for level in range(max(levels) + 1 if levels else 0):
+            wave = [i for i, lvl in enumerate(levels) if lvl == level]
+
+            collaboration_history = "".join(history_parts)
+
+            wave_agents = []
+            wave_prompts = []
+            for i in wave:
+                step = plan_steps[i]
+                agent_name = step["agent"]
+                action = step["action"]
+
+                print(f"\n--- [Collaboration] Executing Step {i + 1} ---")
+                print(f"  Agent: {agent_name}")
+                print(f"  Action: {action}")
+
+                agent = agent_map.get(agent_name)
+                if not agent:
+                    raise ValueError(f"Agent '{agent_name}' not found")
+
+                wave_agents.append(agent)
+                wave_prompts.append(self._format_prompt_with_history(
+                    task_description,
+                    collaboration_history,
+                    agent,
+                    action
+                ))
+
+            # 同一波的步骤并发执行，不再有修正循环
+            wave_outputs = await asyncio.gather(
+                *(agent.generate(prompt) for agent, prompt in zip(wave_agents, wave_prompts))
             )
 
-            # 直接执行，不再有修正循环
-            step_output_text = await agent.generate(prompt)
-            print(f"  Step Output (truncated): {step_output_text[:150]}...")
+            for i, agent, step_output_text in zip(wave, wave_agents, wave_outputs):
+                action = plan_steps[i]["action"]
+                print(f"  Step {i + 1} Output (truncated): {step_output_text[:150]}...")
 
-            collaboration_history += f"--- Step {i + 1}: Agent '{agent.name}' ({action}) ---\n"
-            collaboration_history += f"{step_output_text}\n\n"
+                # 只追加新块；历史前缀保持稳定，服务商的prompt前缀缓存也能跨步骤命中
+                history_parts.append(
+                    f"--- Step {i + 1}: Agent '{agent.name}' ({action}) ---\n{step_output_text}\n\n")
+                step_outputs[i] = step_output_text
 
-            last_output = step_output_text
-            final_result["steps"].append({"agent": agent_name, "action": action, "output": step_output_text})
+        # 按计划顺序汇总结果，最终输出为计划中最后一个步骤的输出
+        for i, step in enumerate(plan_steps):
+            final_result["steps"].append(
+                {"agent": step["agent"], "action": step["action"], "output": step_outputs[i]})
+        if plan_steps:
+            last_output = step_outputs[len(plan_steps) - 1]
 
         final_result["output"] = last_output
-        final_result["context"] = {k: v for k, v in context.items() if k != "agents"}
+        # 过滤掉agents后只剩task_description，直接构建，省去一次遍历和防御性拷贝
+        final_result["context"] = {"task_description": task_description}
 
         return final_result
 
     def _format_prompt_with_history(self, task_description: str, history: str, agent: Agent, action: str) -> str:
         """为Agent构建包含完整上下文的Prompt。"""
-        prompt = f"**Original Task:**\n{task_description}\n\n"
-
-        if history:
-            prompt += f"**Collaboration History (Previous Steps):**\n{history}\n"
-        else:
-            prompt += "**Collaboration History (Previous Steps):**\nThis is the first step. There is no history yet.\n\n"
-
-        prompt += f"**Your Current Task:**\n"
-        prompt += f"You are agent '{agent.name}'. Your role is: {agent.role}.\n"
-        prompt += f"Your current action is: '{action}'.\n"
-        prompt += "Based on the original task and the full collaboration history, please perform your action. Provide a clear, comprehensive response."
-
-        return prompt
\ No newline at end of file
+        history_block = f"{history}\n" if history else self._EMPTY_HISTORY_BLOCK
+        return "".join((
+            "**Original Task:**\n", task_description,
+            "\n\n**Collaboration History (Previous Steps):**\n", history_block,
+            "**Your Current Task:**\n",
+            "You are agent '", agent.name, "'. Your role is: ", str(agent.role), ".\n",
+            "Your current action is: '", action, "'.\n",
+            self._PROMPT_TAIL,
+        ))
@@ -1,61 +1,173 @@
 # core/evolution_engine.py
-import re
+import asyncio
 from typing import Dict, Any, List
-import json
 from agents.base_agent import Agent
 from .agent_factory import AgentFactory
-from utils.prompt_utils import load_prompt_template
-from utils.json_utils import extract_and_parse_json
+from utils.prompt_utils import render_prompt
+from utils.json_utils import dump_json, extract_and_parse_json
+
+# 每种agent_type一把锁：并发进化时保持对模板的"最后写入生效"语义
+_TEMPLATE_LOCKS: Dict[str, asyncio.Lock] = {}
+
+# 改进计划的近似缓存：同类失败换一种措辞描述时，精确匹配缓存会失手，
+# 这里按词集重合度做近似命中，复用此前生成的改进计划，省一次LLM调用
+_PLAN_CACHE_MAX_SIZE = 512
+_PLAN_CACHE: List[tuple] = []  # [(词集, 改进计划列表), ...]，按插入顺序，满了淘汰最旧
+
+
+def _plan_cache_words(task_analysis: Dict, root_cause: str) -> frozenset:
+    """把失败描述归一化为小写词集，作为近似匹配的特征。"""
+    text = f"{task_analysis.get('task_type', '')} {root_cause}"
+    return frozenset(text.lower().split())
+
+
+def _plan_cache_lookup(words: frozenset, threshold: float) -> List[Dict]:
+    """在计划缓存中寻找词集Jaccard相似度达到阈值的条目。"""
+    if not words:
+        return None
+    best, best_plans = 0.0, None
+    for cached_words, plans in _PLAN_CACHE:
+        union = len(words | cached_words)
+        if union == 0:
+            continue
+        similarity = len(words & cached_words) / union
+        if similarity >= threshold and similarity > best:
+            best, best_plans = similarity, plans
+    return best_plans
+
+
+def _plan_cache_store(words: frozenset, plans: List[Dict]) -> None:
+    if not words:
+        return
+    if len(_PLAN_CACHE) >= _PLAN_CACHE_MAX_SIZE:
+        _PLAN_CACHE.pop(0)
+    _PLAN_CACHE.append((words, plans))
 
 
 class EvolutionEngine:
     """
     自我进化引擎，负责改进Agent模板和协作流程
     """
+    # 批量评测会创建多个MetaAgent，各自持有一个EvolutionEngine；
+    # EvolutionAgent本身无任务态，跨实例共享一个即可（HTTP连接池已在
+    # utils.http_client 层共享，这里进一步省去重复构造Agent的开销）
+    _shared_evolution_agent: Agent = None
+
     def __init__(self, config: Dict, agent_factory: AgentFactory):
         self.config = config
         self.agent_factory = agent_factory
-        self.evolution_agent = Agent(
-            name="EvolutionAgent",
-            system_prompt="You are an AI system optimization specialist...", # (不变)
-            config=config
-        )
+        if EvolutionEngine._shared_evolution_agent is None:
+            EvolutionEngine._shared_evolution_agent = Agent(
+                name="EvolutionAgent",
+                system_prompt="You are an AI system optimization specialist...", # (不变)
+                config=config
+            )
+        self.evolution_agent = EvolutionEngine._shared_evolution_agent
 
     async def evolve_from_correction(self, task_analysis: Dict, root_cause: str, abstract_takeaways: List[str]):
         """基于对错误的深刻分析进行系统进化。"""
         print(f"  Analyzing correction takeaways for evolution...")
 
-        prompt = load_prompt_template("improve_system_from_correction").format(
-            task_analysis_json=json.dumps(task_analysis, indent=2),
-            root_cause=root_cause,
-            abstract_takeaways_json=json.dumps(abstract_takeaways, indent=2)
-        )
+        # 近似缓存：同类失败的不同措辞也能命中，直接复用此前的改进计划
+        cache_words = _plan_cache_words(task_analysis, root_cause)
+        threshold = self.config.get("plan_cache_threshold", 0.95)
+        plans = _plan_cache_lookup(cache_words, threshold)
+        if plans is not None:
+            print("  Reusing improvement plan from a similar past failure (plan cache hit).")
+        else:
+            prompt = render_prompt(
+                "improve_system_from_correction",
+                task_analysis_json=dump_json(task_analysis),
+                root_cause=root_cause,
+                abstract_takeaways_json=dump_json(abstract_takeaways)
+            )
 
-        response_text = await self.evolution_agent.generate(prompt)
+            response_text = await self.evolution_agent.generate(prompt)
 
-        # 简单的json提取
-        match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if match:
-            try:
-                improvement_plan = json.loads(match.group(0))
-            except json.JSONDecodeError:
-                improvement_plan = None
-        else:
-            improvement_plan = None
+            # 用共享的提取工具做定界扫描+解析，避免每次调用都在大响应上
+            # 跑贪婪的 \{.*\} 正则（可能灾难性回溯）
+            improvement_plan = extract_and_parse_json(response_text)
+
+            # 兼容单个计划对象或计划数组
+            plans = improvement_plan if isinstance(improvement_plan, list) else [improvement_plan]
+            plans = [p for p in plans
+                     if isinstance(p, dict) and "element_to_improve" in p and p.get("type") == "agent_template"]
+            if plans:
+                _plan_cache_store(cache_words, plans)
 
-        if not improvement_plan or "element_to_improve" not in improvement_plan:
+        if not plans:
             print("  FAILURE: Could not generate a valid improvement plan from the correction analysis.")
             return
 
         print("  Generated improvement plan from correction analysis:")
-        print(json.dumps(improvement_plan, indent=2))
+        print(dump_json(plans, pretty=True))
 
-        if improvement_plan.get("type") == "agent_template":
-            await self._evolve_agent_template(
-                agent_type=improvement_plan.get("element_to_improve"),
-                suggestions=improvement_plan.get("suggestions", []),
+        # 多个改进区域时优先合并为一次LLM调用（共享前缀，单次HTTP往返）；
+        # 批量响应不合规时回退到逐项并发路径
+        if len(plans) > 1:
+            batch_ok = await self._evolve_agent_templates_batch(plans, root_cause, abstract_takeaways)
+            if batch_ok:
+                return
+
+        # 各改进区域是相互独立的LLM往返，并发进化后耗时约等于最慢一项而非总和；
+        # return_exceptions 保证单项解析失败不会连累其余项
+        results = await asyncio.gather(
+            *(self._evolve_agent_template(
+                agent_type=plan.get("element_to_improve"),
+                suggestions=plan.get("suggestions", []),
                 context_info={"root_cause": root_cause, "takeaways": abstract_takeaways}
-            )
+            ) for plan in plans),
+            return_exceptions=True
+        )
+        for plan, res in zip(plans, results):
+            if isinstance(res, Exception):
+                print(f"  FAILURE: Evolution of '{plan.get('element_to_improve')}' raised: {res}")
+
+    async def _evolve_agent_templates_batch(self,
+                                            plans: List[Dict],
+                                            root_cause: str,
+                                            abstract_takeaways: List[str]) -> bool:
+        """
+        把N个模板的改进打包成一次LLM调用，返回是否至少成功保存了一个模板。
+        """
+        areas = []
+        for plan in plans:
+            agent_type = plan.get("element_to_improve")
+            current_template = self.agent_factory.agent_templates.get(agent_type, {
+                "system_prompt": f"You are a helpful {agent_type} assistant."
+            })
+            areas.append({
+                "agent_type": agent_type,
+                "current_template": current_template,
+                "suggestions": plan.get("suggestions", []),
+            })
+
+        prompt = render_prompt(
+            "improve_agent_templates_batch",
+            areas_json=dump_json(areas),
+            context_info=dump_json({"root_cause": root_cause, "takeaways": abstract_takeaways})
+        )
+
+        response_text = await self.evolution_agent.generate(prompt)
+        parsed = extract_and_parse_json(response_text)
+        if not isinstance(parsed, list):
+            print("  WARNING: Batched template response was malformed; falling back to per-area evolution.")
+            return False
+
+        saved = 0
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            agent_type = item.get("agent_type")
+            improved_template = item.get("improved_template")
+            new_prompt = improved_template.get("system_prompt") if isinstance(improved_template, dict) else None
+            if agent_type and isinstance(new_prompt, str) and len(new_prompt) > 20:
+                await self.agent_factory.save_agent_template(agent_type, improved_template)
+                print(f"  SUCCESS: Evolved and saved new template for '{agent_type}' (batched).")
+                saved += 1
+            else:
+                print(f"  FAILURE: Batched template for '{agent_type}' was invalid or too short. Skipped.")
+        return saved > 0
 
     async def _evolve_agent_template(self,
                                      agent_type: str,
@@ -66,20 +178,33 @@ class EvolutionEngine:
             print("  FAILURE: Cannot evolve agent template without an agent_type.")
             return
 
+        # 同一agent_type的并发进化串行化，读-改-写模板时保持最后写入生效
+        lock = _TEMPLATE_LOCKS.setdefault(agent_type, asyncio.Lock())
+        async with lock:
+            await self._evolve_agent_template_locked(agent_type, suggestions, context_info)
+
+    async def _evolve_agent_template_locked(self,
+                                            agent_type: str,
+                                            suggestions: List[str],
+                                            context_info: Dict):
         print(f"  Attempting to evolve agent template: {agent_type}")
-        current_template = self.agent_factory.agent_templates.get(agent_type, {
-            "system_prompt": f"You are a helpful {agent_type} assistant."
-        })
 
-        prompt = load_prompt_template("improve_agent_template").format(
+        prompt = render_prompt(
+            "improve_agent_template",
             agent_type=agent_type,
-            current_template=json.dumps(current_template, indent=2),
-            context_info=json.dumps(context_info, indent=2),
-            suggestions=json.dumps(suggestions, indent=2)
+            current_template=self.agent_factory.get_template_json(agent_type),
+            context_info=dump_json(context_info),
+            suggestions=dump_json(suggestions)
         )
 
-        response_dict = await self.evolution_agent.generate(prompt)
-        response_text = response_dict.get("response", "")
+        # 指令+当前模板是稳定的大段前缀，本次失败的上下文和建议才是动态部分；
+        # 把前缀并入system消息，服务商的prompt前缀缓存可以跨进化调用命中
+        static_prefix, sep, dynamic_tail = prompt.partition("PERFORMANCE CONTEXT:")
+        if sep:
+            response_text = await self.evolution_agent.generate(
+                sep + dynamic_tail, cacheable_prefix=static_prefix.rstrip())
+        else:
+            response_text = await self.evolution_agent.generate(prompt)
         improved_template = extract_and_parse_json(response_text)
 
         if improved_template and "system_prompt" in improved_template:
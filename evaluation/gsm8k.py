@@ -4,8 +4,16 @@ import os
 import asyncio
 import re
 from typing import Dict, Any, List
-import urllib.request
 from core.meta_agent import MetaAgent
+from utils.dataset_utils import download_file, load_jsonl
+from utils.log_utils import flush_progress, get_progress_logger
+
+# 答案提取正则在模块导入时编译一次，热循环里直接用编译对象
+_HASH_ANSWER_RE = re.compile(r"####\s*([0-9,.]+)$")
+_NUMBER_RE = re.compile(r'[\d\.]+')
+
+# 逐题进度走缓冲logger：按批写stdout，免去高并发下每行一次write系统调用
+_PROGRESS = get_progress_logger("gsm8k")
 
 
 class Gsm8kRunner:
@@ -22,7 +30,7 @@ class Gsm8kRunner:
     def _extract_final_answer(self, text: str) -> str:
         """从文本中提取最终答案"""
         # 寻找 "#### <数字>" 格式的答案
-        match = re.search(r"####\s*([0-9,.]+)$", text)
+        match = _HASH_ANSWER_RE.search(text)
         if match:
             answer = match.group(1).replace(",", "")
             # 处理可能尾随的句点
@@ -31,7 +39,7 @@ class Gsm8kRunner:
             return answer
 
         # 如果没有找到标准格式，回退到寻找文本中最后一个数字
-        matches = re.findall(r'[\d\.]+', text)
+        matches = _NUMBER_RE.findall(text)
         if matches:
             return matches[-1]
 
@@ -49,14 +57,23 @@ class Gsm8kRunner:
         """
         await self._ensure_dataset()
         problems = self._load_problems(num_problems)
-        results = []
 
-        for i, problem in enumerate(problems):
-            print(f"Evaluating problem {i + 1}/{len(problems)}: {problem['question'][:50]}...")
-            result = await self._evaluate_problem(problem)
-            results.append(result)
-            passed = "PASS" if result["passed"] else "FAIL"
-            print(f"  Result: {passed} (Agent: {result['generated_answer']}, Correct: {result['correct_answer']})")
+        # 问题之间相互独立、以LLM延迟为主，限流并发评估
+        semaphore = asyncio.Semaphore(self.config.get("concurrency", 8))
+
+        async def _bounded(index: int, problem: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                _PROGRESS.info("Evaluating problem %d/%d: %s...",
+                               index + 1, len(problems), problem['question'][:50])
+                result = await self._evaluate_problem(problem)
+                _PROGRESS.info("  [%d/%d] Result: %s (Agent: %s, Correct: %s)",
+                               index + 1, len(problems),
+                               "PASS" if result["passed"] else "FAIL",
+                               result['generated_answer'], result['correct_answer'])
+                return result
+
+        results = await asyncio.gather(*(_bounded(i, p) for i, p in enumerate(problems)))
+        flush_progress()
 
         stats = self._compute_statistics(results)
         return {
@@ -74,7 +91,7 @@ class Gsm8kRunner:
         generated_text = result_obj.get("output", "")
 
         generated_answer = self._extract_final_answer(generated_text)
-        correct_answer = self._extract_final_answer(problem['answer'])
+        correct_answer = problem["_correct"]
 
         passed = generated_answer == correct_answer
 
@@ -87,28 +104,26 @@ class Gsm8kRunner:
         }
 
     async def _ensure_dataset(self) -> None:
-        """确保GSM8K数据集存在"""
+        """确保GSM8K数据集存在（异步流式下载，不阻塞事件循环）"""
         os.makedirs(os.path.dirname(self.dataset_path), exist_ok=True)
 
         if not os.path.exists(self.dataset_path):
             print("Downloading GSM8K dataset...")
             url = "https://raw.githubusercontent.com/openai/grade-school-math/master/grade_school_math/data/test.jsonl"
             try:
-                urllib.request.urlretrieve(url, self.dataset_path)
+                await download_file(url, self.dataset_path)
                 print("Download complete.")
             except Exception as e:
                 print(f"Failed to download dataset: {e}")
                 raise
 
     def _load_problems(self, num_problems: int = None) -> List[Dict[str, Any]]:
-        """加载GSM8K问题"""
-        problems = []
-        with open(self.dataset_path, "r", encoding='utf-8') as f:
-            for line in f:
-                problems.append(json.loads(line))
-
-        if num_problems is not None:
-            problems = problems[:num_problems]
+        """加载GSM8K问题（经进程内LRU缓存，重复运行不再重读重解析）"""
+        problems = load_jsonl(self.dataset_path, num_problems)
+        # 标准答案提取一次存回问题字典，评估循环只对模型输出跑正则
+        for problem in problems:
+            if "_correct" not in problem:
+                problem["_correct"] = self._extract_final_answer(problem["answer"])
         return problems
 
     def _compute_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
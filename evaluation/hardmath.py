@@ -1,10 +1,19 @@
 # evaluation/hardmath.py
-import json
 import os
 import asyncio
 import re
+from fractions import Fraction
 from typing import Dict, Any, List
 from core.meta_agent import MetaAgent
+from utils.dataset_utils import load_json_values
+from utils.log_utils import flush_progress, get_progress_logger
+
+# 答案提取正则在模块导入时编译一次
+_BOXED_RE = re.compile(r"\\boxed{(.+?)}", re.DOTALL)
+_HASH_RE = re.compile(r"####\s*(.+)$")
+
+# 逐题进度走缓冲logger：按批写stdout，免去高并发下每行一次write系统调用
+_PROGRESS = get_progress_logger("hardmath")
 
 
 class HardMathRunner:
@@ -22,33 +31,53 @@ class HardMathRunner:
     def _extract_final_answer(self, text: str) -> str:
         """从文本中提取最终答案，优先匹配 \\boxed{...}"""
         # 优先寻找 \boxed{...} 格式的答案
-        boxed_match = re.search(r"\\boxed{(.+?)}", text, re.DOTALL)
+        boxed_match = _BOXED_RE.search(text)
         if boxed_match:
             return boxed_match.group(1).strip()
 
         # 其次寻找 #### <答案> 格式
-        match = re.search(r"####\s*(.+)$", text)
+        match = _HASH_RE.search(text)
         if match:
             return match.group(1).strip()
 
         # 如果都没有，返回空字符串
         return ""
 
+    @staticmethod
+    def _normalize_answer(answer: Any) -> str:
+        """归一化答案文本：去空白/美元符/千位逗号/尾随句点、转小写"""
+        text = str(answer).strip().replace("$", "").replace(",", "").lower()
+        return text.rstrip(".")
+
+    def _answers_match(self, generated_answer: Any, correct_answer: Any) -> bool:
+        """
+        判断生成答案与标准答案是否一致。
+        先做格式归一化，再尝试按精确分数比较数值相等
+        （'0.5' vs '1/2'、'70.0' vs '70'），纯格式差异不再被误判为错误。
+        """
+        normalized_generated = self._normalize_answer(generated_answer)
+        normalized_correct = self._normalize_answer(correct_answer)
+        if normalized_generated == normalized_correct:
+            return True
+        try:
+            return Fraction(normalized_generated) == Fraction(normalized_correct)
+        except (ValueError, ZeroDivisionError):
+            return False
+
     def _load_problems(self, file_path: str, num_problems: int = None) -> List[Dict[str, Any]]:
         """从 JSON 文件加载 HARDMath 问题"""
         if not os.path.exists(file_path):
             print(f"错误: 数据集文件未找到于 {file_path}")
             return []
 
-        with open(file_path, "r", encoding='utf-8') as f:
-            data = json.load(f)
-
-        # 将字典转换为列表
-        problems = [value for key, value in data.items()]
+        # 经进程内LRU缓存的加载：进化+测试两阶段共用训练/测试文件时免重读
+        return load_json_values(file_path, num_problems)
 
-        if num_problems is not None:
-            return problems[:num_problems]
-        return problems
+    async def preload(self) -> None:
+        """预热训练/测试数据集的进程内缓存；文件I/O在线程池执行，可与进化阶段并行"""
+        await asyncio.gather(
+            asyncio.to_thread(self._load_problems, self.train_dataset_path),
+            asyncio.to_thread(self._load_problems, self.test_dataset_path))
 
     async def run_evolution_phase(self, num_problems: int = 10):
         """
@@ -61,11 +90,12 @@ class HardMathRunner:
             return
 
         for i, problem in enumerate(train_problems):
-            print(f"Evolving on problem {i + 1}/{len(train_problems)}...")
+            _PROGRESS.info("Evolving on problem %d/%d...", i + 1, len(train_problems))
 
             # 在进化阶段，allow_evolution 设置为 True
             await self._evaluate_problem(problem, allow_evolution=True)
 
+        flush_progress()
         print("--- [HardMath] Evolution Phase Completed ---\n")
 
     async def run_testing_phase(self, num_problems: int = None) -> Dict[str, Any]:
@@ -78,18 +108,24 @@ class HardMathRunner:
         if not test_problems:
             return {}
 
-        results = []
-        for i, problem in enumerate(test_problems):
-            print(f"Testing on problem {i + 1}/{len(test_problems)}: {problem['question'][:50]}...")
-
-            # 在测试阶段，allow_evolution 设置为 False
-            result = await self._evaluate_problem(problem, allow_evolution=False)
-            results.append(result)
-
-            passed_str = "PASS" if result["passed"] else "FAIL"
-            print(f"  Result: {passed_str}")
-            print(f"    Generated: {result['generated_answer'][:80]}...")
-            print(f"    Correct:   {result['correct_answer'][:80]}...")
+        # 测试阶段不进化、问题相互独立，限流并发评估；
+        # 进化阶段会修改共享的meta_agent，仍保持顺序执行
+        semaphore = asyncio.Semaphore(self.config.get("concurrency", 8))
+
+        async def _bounded(index: int, problem: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                _PROGRESS.info("Testing on problem %d/%d: %s...",
+                               index + 1, len(test_problems), problem['question'][:50])
+                result = await self._evaluate_problem(problem, allow_evolution=False)
+                _PROGRESS.info("  [%d/%d] Result: %s\n    Generated: %s...\n    Correct:   %s...",
+                               index + 1, len(test_problems),
+                               "PASS" if result["passed"] else "FAIL",
+                               result['generated_answer'][:80],
+                               result['correct_answer'][:80])
+                return result
+
+        results = await asyncio.gather(*(_bounded(i, p) for i, p in enumerate(test_problems)))
+        flush_progress()
 
         stats = self._compute_statistics(results)
         print("--- [HardMath] Testing Phase Completed ---\n")
@@ -111,8 +147,8 @@ class HardMathRunner:
         generated_answer = self._extract_final_answer(generated_text)
         correct_answer = problem.get('answer_val', '')
 
-        # 简单的字符串匹配来判断正确性
-        passed = generated_answer == correct_answer
+        # 归一化+数值等价比较：格式差异不再触发误判
+        passed = self._answers_match(generated_answer, correct_answer)
 
         return {
             "question": problem['question'],
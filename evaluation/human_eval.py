@@ -1,16 +1,76 @@
 # evaluation/human_eval.py
+import ast
 import json
 import os
 import asyncio
-from operator import index
+import re
+import sys
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import Dict, Any, List
-import tempfile
-import subprocess
-import importlib.util
-import urllib.request
 
 from core.meta_agent import MetaAgent
 from utils.evaluation import CodeEvaluator
+from utils.dataset_utils import download_file, load_jsonl
+from utils.log_utils import flush_progress, get_progress_logger
+
+# 逐题进度走缓冲logger：按批写stdout，免去高并发下每行一次write系统调用
+_PROGRESS = get_progress_logger("human_eval")
+
+# 生成代码常被包在Markdown代码块或提示要求的[code start]标记里
+_CODE_FENCE_RE = re.compile(r"```(?:python)?\s*\n(.*?)```", re.DOTALL)
+_CODE_MARKER_RE = re.compile(r"\[code start\](.*?)\[code end\]", re.DOTALL)
+
+# 长驻测试runner的主循环：从stdin读"<字节数> <入口函数>"头行和源码，
+# 执行后向stdout回写一行PASS/FAIL。worker跨问题复用，
+# 免去每题一次的解释器启动（约30ms）和临时文件读写。
+# 候选代码的exec和check调用包在redirect_stdout里：LLM生成的代码常带print，
+# 不隔离的话杂音行会被父进程当成判定、真正的判定滞留管道毒化worker
+_RUNNER_SOURCE = """
+import contextlib, io, sys
+while True:
+    header = sys.stdin.buffer.readline()
+    if not header:
+        break
+    n_str, entry_point = header.decode().split(" ", 1)
+    source = sys.stdin.buffer.read(int(n_str)).decode()
+    namespace = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(source, namespace)
+            namespace["check"](namespace[entry_point.strip()])
+        sys.stdout.write("PASS\\n")
+    except BaseException as e:
+        sys.stdout.write("FAIL: " + repr(e).replace("\\n", " ") + "\\n")
+    sys.stdout.flush()
+"""
+
+
+@lru_cache(maxsize=256)
+def _function_block_re(function_name: str) -> "re.Pattern":
+    """
+    按函数名缓存的整块提取正则：一次C级匹配捕获从def行到
+    首个缩进不深于它的行为止的整个函数块。
+    """
+    return re.compile(
+        rf"^(?P<lead>[ \t]*)def\s+{re.escape(function_name)}\s*\(.*?(?=^(?P=lead)?\S|\Z)",
+        re.MULTILINE | re.DOTALL)
+
+
+def _run_test_case(source: str, entry_point: str) -> Dict[str, Any]:
+    """
+    在进程池工作进程里内存态执行测试：exec组合源码后调用check(entry_point)。
+    工作进程是长驻的，省去每题一次的解释器启动和临时文件读写。
+    （模块级函数：进程池要求任务可pickle）
+    """
+    namespace: Dict[str, Any] = {}
+    try:
+        exec(source, namespace)
+        namespace["check"](namespace[entry_point])
+        return {"passed": True, "stdout": "PASS", "stderr": "", "return_code": 0}
+    except BaseException as e:
+        return {"passed": False, "stdout": f"FAIL: {e}", "stderr": repr(e), "return_code": 1}
 
 
 class HumanEvalRunner:
@@ -24,6 +84,43 @@ class HumanEvalRunner:
         self.meta_agent = meta_agent
         self.evaluator = CodeEvaluator()
         self.dataset_path = os.path.join("data", "human_eval", "human-eval-v2-20210705.jsonl")
+        # 懒创建的测试执行进程池，工作进程跨问题复用
+        self._pool: ProcessPoolExecutor = None
+        # 隔离模式下的长驻runner子进程池（asyncio.Queue分发空闲worker）
+        self._runner_pool: asyncio.Queue = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+        return self._pool
+
+    def _reset_pool(self) -> None:
+        """杀掉进程池的全部worker并丢弃池子，下次使用时重建。
+        wait_for超时只是放弃等待，死循环的worker仍占着池里的槽位，
+        不杀掉的话后续测试会被毒化的池误判超时，退出时atexit的join也会挂死。"""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for proc in list(getattr(pool, "_processes", {}).values()):
+            proc.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _acquire_runner(self):
+        """取出一个空闲的长驻runner子进程，必要时惰性启动"""
+        if self._runner_pool is None:
+            self._runner_pool = asyncio.Queue()
+            # 先放入空槽位，worker在首次取用时才真正启动
+            for _ in range(os.cpu_count() or 1):
+                self._runner_pool.put_nowait(None)
+        proc = await self._runner_pool.get()
+        if proc is None or proc.returncode is not None:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-u", "-c", _RUNNER_SOURCE,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        return proc
 
     async def run_evaluation(self, num_problems: int = None) -> Dict[str, Any]:
         """
@@ -41,17 +138,21 @@ class HumanEvalRunner:
         # 加载问题
         problems = self._load_problems(num_problems)
 
-        # 运行评估
-        results = []
-        for i, problem in enumerate(problems):
-            print(f"Evaluating problem {i + 1}/{len(problems)}: {problem['task_id']}")
+        # 运行评估：问题相互独立，限流并发执行
+        semaphore = asyncio.Semaphore(self.config.get("concurrency", 8))
 
-            result = await self._evaluate_problem(problem)
-            results.append(result)
+        async def _bounded(index: int, problem: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                _PROGRESS.info("Evaluating problem %d/%d: %s",
+                               index + 1, len(problems), problem['task_id'])
+                result = await self._evaluate_problem(problem)
+                _PROGRESS.info("  [%d/%d] Result: %s",
+                               index + 1, len(problems),
+                               "PASS" if result["passed"] else "FAIL")
+                return result
 
-            # 输出进度
-            passed = "PASS" if result["passed"] else "FAIL"
-            print(f"  Result: {passed}")
+        results = await asyncio.gather(*(_bounded(i, p) for i, p in enumerate(problems)))
+        flush_progress()
 
         # 计算统计信息
         stats = self._compute_statistics(results)
@@ -77,7 +178,7 @@ Function Name: {problem['entry_point']}
 Problem Description:
 {problem['prompt']}
 
-Your function should match this signature exactly: {problem['entry_point']}{self._format_signature(problem['entry_point'], problem['prompt'])}
+Your function should match this signature exactly: {problem['entry_point']}{problem['_sig']}
 
 You should return the answer in the following format:
 
@@ -133,53 +234,122 @@ Return ONLY the function implementation without explanation!
                                       entry_point: str,
                                       test_code: str) -> Dict[str, Any]:
         """
-        测试生成的代码是否通过规范测试
+        测试生成的代码是否通过规范测试。
+        默认走长驻runner子进程（worker跨问题复用，超时可单独杀掉重建）；
+        可配置 humaneval_use_subprocess=False 改走ProcessPoolExecutor，
+        该路径超时时会重建整个进程池。
         """
-        # 创建一个临时文件来测试代码
-        with tempfile.NamedTemporaryFile(suffix=".py", mode="w", delete=False) as f:
-            # 将生成的函数与测试代码组合
-            f.write(f"{function_code}\n\n{test_code}\n\n")
-            # 添加运行测试的代码
-            f.write(f"""
-if __name__ == "__main__":
-    try:
-        check({entry_point})
-        print("PASS")
-    except Exception as e:
-        print(f"FAIL: {{str(e)}}")
-""")
-            temp_path = f.name
-
-        # 运行测试
-        try:
-            process = subprocess.run(
-                ["python", temp_path],
-                capture_output=True,
-                text=True
-            )
+        source = f"{function_code}\n\n{test_code}\n"
+        timeout = self.config.get("test_timeout", 10)
 
-            stdout = process.stdout.strip()
-            stderr = process.stderr.strip()
+        if self.config.get("humaneval_use_subprocess", True):
+            return await self._test_in_subprocess(source, entry_point, timeout)
 
-            passed = "PASS" in stdout and "FAIL" not in stdout
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._get_pool(), _run_test_case, source, entry_point),
+                timeout=timeout)
+        except asyncio.TimeoutError:
+            # 卡死的worker无法被wait_for终止，杀掉并重建进程池防止毒化
+            self._reset_pool()
+            return {"passed": False, "error": "Test execution timed out."}
+        except Exception as e:
+            return {"passed": False, "error": str(e)}
 
+    async def _test_in_subprocess(self, source: str, entry_point: str, timeout: float) -> Dict[str, Any]:
+        """
+        隔离模式：把测试发给长驻runner子进程经stdin/stdout执行。
+        worker跨问题复用，省去每题一次的python启动和临时文件；
+        超时或协议异常时杀掉该worker并向池中补一个空槽位，
+        其余在途测试不受影响。
+        """
+        proc = await self._acquire_runner()
+        try:
+            payload = source.encode()
+            proc.stdin.write(f"{len(payload)} {entry_point}\n".encode())
+            proc.stdin.write(payload)
+            await proc.stdin.drain()
+
+            line = await asyncio.wait_for(proc.stdout.readline(), timeout=timeout)
+            result_line = line.decode(errors="replace").strip()
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            self._runner_pool.put_nowait(None)
             return {
-                "passed": passed,
-                "stdout": stdout,
-                "stderr": stderr,
-                "return_code": process.returncode
+                "passed": False,
+                "error": "Test execution timed out."
             }
         except Exception as e:
+            proc.kill()
+            await proc.wait()
+            self._runner_pool.put_nowait(None)
             return {
                 "passed": False,
                 "error": str(e)
             }
-        finally:
-            # 删除临时文件
-            os.unlink(temp_path)
+
+        if result_line != "PASS" and not result_line.startswith("FAIL"):
+            # 协议外的输出（如候选代码用os.write绕过重定向直写fd 1）：
+            # 真正的判定行可能仍滞留管道，杀掉worker换新，防止后续题目判定错位
+            proc.kill()
+            await proc.wait()
+            self._runner_pool.put_nowait(None)
+            return {"passed": False, "error": f"Unexpected runner output: {result_line!r}"}
+
+        # 正常返回的worker放回池里供下一题复用
+        self._runner_pool.put_nowait(proc)
+        passed = result_line == "PASS"
+        return {
+            "passed": passed,
+            "stdout": result_line,
+            "stderr": "" if passed else result_line,
+            "return_code": 0
+        }
+
+    @staticmethod
+    def _strip_code_markers(code: str) -> str:
+        """剥掉Markdown代码围栏和[code start]/[code end]标记，只留源码"""
+        marker_match = _CODE_MARKER_RE.search(code)
+        if marker_match:
+            code = marker_match.group(1)
+        fence_match = _CODE_FENCE_RE.search(code)
+        if fence_match:
+            code = fence_match.group(1)
+        return code.strip("\n")
 
     def _extract_function(self, code: str, function_name: str) -> str:
-        """从生成的代码中提取函数"""
+        """
+        从生成的代码中提取函数。
+        优先走AST：一次C级解析定位同名FunctionDef并取其源码片段，
+        对字符串里的def、注释、装饰器等边界情况都正确；
+        语法不完整时退回原先的逐行缩进扫描。
+        """
+        code = self._strip_code_markers(code)
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return self._extract_function_heuristic(code, function_name)
+
+        node = next((n for n in ast.walk(tree)
+                     if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name == function_name),
+                    None)
+        # 只接受顶层定义：嵌套函数的源码片段会丢失首行缩进，交给回退逻辑处理
+        if node is not None and node.col_offset == 0:
+            segment = ast.get_source_segment(code, node)
+            if segment:
+                return segment
+        return self._extract_function_heuristic(code, function_name)
+
+    def _extract_function_heuristic(self, code: str, function_name: str) -> str:
+        """回退提取逻辑：先试一次编译正则的整块匹配，再退到逐行缩进扫描"""
+        # 单次C级正则匹配替代每行一次的Python循环；
+        # 模式按函数名经lru_cache复用，语法不完整的代码也能匹配
+        match = _function_block_re(function_name).search(code)
+        if match:
+            return textwrap.dedent(match.group(0)).rstrip("\n")
+
         # 尝试找到函数定义
         lines = code.split("\n")
         function_start = -1
@@ -223,7 +393,7 @@ if __name__ == "__main__":
         return function_code
 
     async def _ensure_dataset(self) -> None:
-        """确保HumanEval数据集存在"""
+        """确保HumanEval数据集存在（异步流式下载，不阻塞事件循环）"""
         os.makedirs(os.path.dirname(self.dataset_path), exist_ok=True)
 
         if not os.path.exists(self.dataset_path):
@@ -231,23 +401,20 @@ if __name__ == "__main__":
             url = "https://github.com/openai/human-eval/raw/master/data/HumanEval.jsonl"
 
             try:
-                urllib.request.urlretrieve(url, self.dataset_path)
+                await download_file(url, self.dataset_path)
                 print("Download complete.")
             except Exception as e:
                 print(f"Failed to download dataset: {e}")
                 raise
 
     def _load_problems(self, num_problems: int = None) -> List[Dict[str, Any]]:
-        """加载HumanEval问题"""
-        problems = []
-
-        with open(self.dataset_path, "r") as f:
-            for line in f:
-                problems.append(json.loads(line))
-
-        if num_problems is not None:
-            problems = problems[:num_problems]
-
+        """加载HumanEval问题（经进程内LRU缓存，重复运行不再重读重解析）"""
+        problems = load_jsonl(self.dataset_path, num_problems)
+        # 签名提取是对prompt的逐行扫描，加载时算一次存回问题字典；
+        # 重试或未来的pass@k多采样不再重复扫描同一prompt
+        for problem in problems:
+            if "_sig" not in problem:
+                problem["_sig"] = self._format_signature(problem["entry_point"], problem["prompt"])
         return problems
 
     def _compute_statistics(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -1,106 +1,331 @@
 # evolving_multi_agent/memory/experience_hub.py
-import networkx as nx
-import json
+import atexit
+import hashlib
 import os
+import threading
+import time
 from typing import Dict, Any, List, Optional
+from memory.graph_lite import LiteGraph
+from utils.json_utils import dump_json, loads
+
+# msgpack是可选依赖：二进制编码比JSON快且文件小30-50%，不可用时退回JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# xxhash是可选依赖：比blake2b更快的非加密哈希
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# numpy是可选依赖：启发式集合变大后用C级argsort替代Python比较排序
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _hash_into(hasher, obj: Any) -> None:
+    """
+    递归地把对象结构流式写入哈希器：字典按键序、容器带类型标记，
+    不构建任何中间JSON字符串——大计划也只付遍历与update的成本。
+    """
+    if isinstance(obj, dict):
+        hasher.update(b"{")
+        for key in sorted(obj):
+            hasher.update(str(key).encode())
+            hasher.update(b":")
+            _hash_into(hasher, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(b"[")
+        for item in obj:
+            _hash_into(hasher, item)
+            hasher.update(b",")
+    else:
+        hasher.update(str(obj).encode())
+        hasher.update(b";")
+
+
+def _concept_id(concept: str) -> str:
+    """概念节点id：去首尾空白、小写、空格转下划线后再拼前缀。
+    添加与检索两侧共用同一归一化，大小写/空白变体不再彼此miss。"""
+    return f"concept_{concept.strip().lower().replace(' ', '_')}"
+
+
+def _content_hash(obj: Any) -> str:
+    """
+    对字符串或嵌套dict/list结构计算稳定的内容哈希。
+    内建hash()按进程加盐随机，跨进程不可复现——用它做节点id会让
+    同一条教训每次运行都生成新节点，计数永远无法累积；
+    这里对结构直接流式哈希（xxhash优先，缺省退回blake2b），
+    既确定又免去整棵计划的序列化。
+    """
+    hasher = xxhash.xxh64() if xxhash is not None else hashlib.blake2b(digest_size=8)
+    if isinstance(obj, str):
+        hasher.update(obj.encode())
+    else:
+        _hash_into(hasher, obj)
+    return hasher.hexdigest()
 
 
 class ExperienceHub:
     def __init__(self, db_path="memory/experience_graph.json"):
         self.db_path = db_path
-        self.graph = nx.DiGraph()
-        self._load_graph()
+        self.msgpack_path = os.path.splitext(db_path)[0] + ".msgpack"
+        # 图延迟加载：--task等单次调用若不触碰经验模块，启动时零图I/O
+        self._graph: Optional[LiteGraph] = None
+        # 检索结果缓存：同一(问题类型, 概念集合)的查询在图未变化时直接复用，
+        # 评测中大量同类任务不必每次重新遍历图
+        self._retrieval_cache: Dict[tuple, Dict] = {}
+        # 启发式检索记忆化：键里带图版本号，图一变旧条目自然失效
+        self._graph_version = 0
+        self._heuristics_cache: Dict[tuple, List[str]] = {}
+        # 落盘去抖：突发的连续add_experience只写一次盘，间隔内的变更
+        # 先挂起、到期或进程退出时统一冲刷（add_experience在工作线程执行，
+        # 用线程锁保护保存路径）
+        self._save_debounce_seconds = 0.2
+        self._last_save_at = 0.0
+        self._pending_save = False
+        self._save_lock = threading.Lock()
+        # 变更锁：add_experience经asyncio.to_thread并发执行，图和反向索引的
+        # 整个修改序列必须互斥，否则交错更新会损坏索引与计数
+        # （与_save_lock分开，_schedule_save在变更锁内部还要拿保存锁）
+        self._mutation_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @property
+    def graph(self) -> LiteGraph:
+        """首次访问时才从磁盘加载经验图并建立索引"""
+        self._ensure_loaded()
+        return self._graph
+
+    def _ensure_loaded(self):
+        if self._graph is None:
+            self._graph = LiteGraph()
+            self._load_graph()
+            self._migrate_node_ids()
+            self._build_indexes()
+
+    def _migrate_node_ids(self):
+        """
+        一次性迁移：旧图里的节点id来自加盐随机的内建hash()，跨进程
+        不可复现；按存储的text/plan重算稳定内容哈希id，重复节点合并计数。
+        """
+        renames: Dict[str, str] = {}
+        for node_id, attrs in self._graph.nodes(data=True):
+            node_type = attrs.get('type')
+            if node_type == 'heuristic' and 'text' in attrs:
+                wanted = f"heuristic_{_content_hash(attrs['text'])}"
+            elif node_type == 'successful_pattern' and 'plan' in attrs:
+                wanted = f"pattern_{_content_hash(attrs['plan'])}"
+            elif node_id.startswith("concept_"):
+                # 概念节点同样归一化，旧的大小写/空白变体并入同一节点
+                wanted = _concept_id(node_id[len("concept_"):])
+            else:
+                continue
+            if wanted != node_id:
+                renames[node_id] = wanted
+        if renames:
+            self._graph.relabel_nodes(renames)
+            with self._save_lock:
+                self._pending_save = True
+
+    def _build_indexes(self):
+        """
+        一次性扫描图，构建热查询用的反向索引：
+        来源节点(problem_*/concept_*)到启发式节点的邻接集合，
+        以及每个启发式的净得分表。此后检索不再走图的successor遍历。
+        """
+        self._heuristics_by_source: Dict[str, set] = {}
+        self._heuristic_score: Dict[str, int] = {}
+        for node, attrs in self.graph.nodes(data=True):
+            if attrs.get('type') == 'heuristic':
+                self._heuristic_score[node] = (attrs.get('positive_count', 0)
+                                               - attrs.get('negative_count', 0))
+        for u, v in self.graph.edges():
+            if v in self._heuristic_score:
+                self._heuristics_by_source.setdefault(u, set()).add(v)
 
     def _load_graph(self):
-        """从文件加载经验图。"""
-        if os.path.exists(self.db_path):
+        """从文件加载经验图。优先读msgpack二进制，旧JSON文件用于迁移。"""
+        if msgpack is not None and os.path.exists(self.msgpack_path):
+            with open(self.msgpack_path, 'rb') as f:
+                data = msgpack.unpackb(f.read(), raw=False)
+            self._graph = self._graph_from_data(data)
+        elif os.path.exists(self.db_path):
+            # 整读后用orjson优先的loads解析，大图的冷启动解析快数倍
             with open(self.db_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.graph = nx.node_link_graph(data)
+                data = loads(f.read())
+            self._graph = self._graph_from_data(data)
         else:
             print("未找到经验图，将创建一个新的。")
 
+    @staticmethod
+    def _graph_from_data(data: Dict[str, Any]) -> LiteGraph:
+        """识别新旧两种落盘格式：{"nodes","adj"} 或 networkx node_link_data"""
+        if "adj" in data:
+            return LiteGraph.from_dict(data)
+        return LiteGraph.from_node_link_data(data)
+
     def _save_graph(self):
-        """将经验图保存到文件。"""
+        """将经验图保存到文件。先写.tmp再原子改名，崩溃不会留下残缺图。"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        data = nx.node_link_data(self.graph)
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        data = self.graph.to_dict()
+        if msgpack is not None:
+            # 二进制落盘：编解码都比文本JSON快，文件也更小
+            target = self.msgpack_path
+            with open(target + ".tmp", 'wb') as f:
+                f.write(msgpack.packb(data, use_bin_type=True))
+        else:
+            # orjson优先的序列化：图随经验增长后，每次落盘的编码成本降数倍
+            target = self.db_path
+            with open(target + ".tmp", 'w', encoding='utf-8') as f:
+                f.write(dump_json(data, pretty=True))
+        os.replace(target + ".tmp", target)
 
     def add_experience(self, task_analysis: Dict, result: Dict, evaluation: Dict, learnings: Optional[Dict] = None):
-        """存储经验，优先存储从学习中提取的抽象启发式策略。"""
-        problem_type = task_analysis.get('task_type', 'generic')
-        concepts = task_analysis.get('knowledge_domains', [])
+        """存储经验，优先存储从学习中提取的抽象启发式策略。
+        在工作线程里执行，整个图/索引变更序列持变更锁互斥。"""
+        with self._mutation_lock:
+            self._ensure_loaded()
+            problem_type = task_analysis.get('task_type', 'generic')
+            concepts = task_analysis.get('knowledge_domains', [])
+            # 脏标记：只有真正改动了图才付缓存失效和落盘的成本
+            mutated = False
+
+            # 存储从失败中学习到的抽象教训
+            if learnings and learnings.get('abstract_takeaways'):
+                for takeaway in learnings['abstract_takeaways']:
+                    if not takeaway.strip(): continue
+                    mutated = True
+                    heuristic_id = f"heuristic_{_content_hash(takeaway)}"
+                    if not self.graph.has_node(heuristic_id):
+                        self.graph.add_node(heuristic_id, type='heuristic', text=takeaway, positive_count=0,
+                                            negative_count=1)
+                        self._heuristic_score[heuristic_id] = -1
+                    else:
+                        self.graph.nodes[heuristic_id]['negative_count'] += 1
+                        self._heuristic_score[heuristic_id] -= 1
+
+                    # 将启发式策略关联到问题类型和概念，并同步维护反向索引
+                    self.graph.add_edge(f"problem_{problem_type}", heuristic_id)
+                    self._heuristics_by_source.setdefault(f"problem_{problem_type}", set()).add(heuristic_id)
+                    for concept in concepts:
+                        concept_node = _concept_id(concept)
+                        self.graph.add_edge(concept_node, heuristic_id)
+                        self._heuristics_by_source.setdefault(concept_node, set()).add(heuristic_id)
+                print(f"  [记忆模块] 从失败中学习并存储了 {len(learnings['abstract_takeaways'])} 条启发式教训。")
+
+            # 如果任务成功，将成功的计划与相关启发式策略关联起来
+            elif (evaluation.get('score') or 0) >= 0.8:
+                plan = result.get('context', {}).get('collaboration_plan')
+                if plan:
+                    mutated = True
+                    pattern_id = f"pattern_{_content_hash(plan)}"
+                    self.graph.add_node(pattern_id, type='successful_pattern', plan=plan)
+                    self.graph.add_edge(f"problem_{problem_type}", pattern_id)
+                    # 将这个成功模式与该问题类型已知的所有启发式策略关联
+                    # 表示这个模式符合这些好的实践
+                    # （按节点id关联；此前误用启发式文本当id，会在图里
+                    # 创建无属性的文本节点并在计数时KeyError）
+                    for heuristic_id in self._relevant_heuristic_ids(problem_type, concepts):
+                        self.graph.add_edge(heuristic_id, pattern_id)
+                        self.graph.nodes[heuristic_id]['positive_count'] += 1
+                        self._heuristic_score[heuristic_id] += 1
+                print(f"  [记忆模块] 存储了1条成功的协作模式。")
+
+            # 图没有实际变化（无教训、未成功或无计划）时跳过失效与落盘
+            if not mutated:
+                return
 
-        # 存储从失败中学习到的抽象教训
-        if learnings and learnings.get('abstract_takeaways'):
-            for takeaway in learnings['abstract_takeaways']:
-                if not takeaway.strip(): continue
-                heuristic_id = f"heuristic_{hash(takeaway)}"
-                if not self.graph.has_node(heuristic_id):
-                    self.graph.add_node(heuristic_id, type='heuristic', text=takeaway, positive_count=0,
-                                        negative_count=1)
-                else:
-                    self.graph.nodes[heuristic_id]['negative_count'] += 1
-
-                # 将启发式策略关联到问题类型和概念
-                self.graph.add_edge(f"problem_{problem_type}", heuristic_id)
-                for concept in concepts:
-                    self.graph.add_edge(f"concept_{concept}", heuristic_id)
-            print(f"  [记忆模块] 从失败中学习并存储了 {len(learnings['abstract_takeaways'])} 条启发式教训。")
-
-        # 如果任务成功，将成功的计划与相关启发式策略关联起来
-        elif evaluation.get('score', 0) >= 0.8:
-            plan = result.get('context', {}).get('collaboration_plan')
-            if plan:
-                pattern_id = f"pattern_{hash(json.dumps(plan, sort_keys=True))}"
-                self.graph.add_node(pattern_id, type='successful_pattern', plan=plan)
-                self.graph.add_edge(f"problem_{problem_type}", pattern_id)
-                # 将这个成功模式与该问题类型已知的所有启发式策略关联
-                # 表示这个模式符合这些好的实践
-                for heuristic_id in self.retrieve_relevant_heuristics(task_analysis):
-                    self.graph.add_edge(heuristic_id, pattern_id)
-                    self.graph.nodes[heuristic_id]['positive_count'] += 1
-            print(f"  [记忆模块] 存储了1条成功的协作模式。")
-
-        self._save_graph()
+            # 图发生变化：版本号递增使记忆化条目失效，检索缓存直接清空
+            self._graph_version += 1
+            self._heuristics_cache.clear()
+            self._retrieval_cache.clear()
+            self._schedule_save()
+
+    def _schedule_save(self):
+        """去抖的落盘调度：距上次保存不足去抖窗口时只标记挂起"""
+        with self._save_lock:
+            now = time.monotonic()
+            if now - self._last_save_at >= self._save_debounce_seconds:
+                self._save_graph()
+                self._last_save_at = now
+                self._pending_save = False
+            else:
+                self._pending_save = True
+
+    def flush(self):
+        """把挂起的图变更立即落盘（进程退出时由atexit调用）"""
+        with self._save_lock:
+            if self._pending_save:
+                self._save_graph()
+                self._last_save_at = time.monotonic()
+                self._pending_save = False
 
     def retrieve_relevant_heuristics(self, task_analysis: Dict) -> List[str]:
         """根据任务类型和概念，检索最相关的启发式策略文本。"""
+        self._ensure_loaded()
         problem_type = task_analysis.get('task_type', 'generic')
         concepts = task_analysis.get('knowledge_domains', [])
 
-        relevant_heuristic_ids = set()
+        # 评测循环里大量任务分析完全相同，记忆化省掉重复的图遍历与排序；
+        # 概念排序后入键，顺序不同的同一概念集合命中同一条目
+        cache_key = (self._graph_version, problem_type, tuple(sorted(concepts)))
+        cached = self._heuristics_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
 
-        # 从问题类型查找
-        source_nodes = [f"problem_{problem_type}"] + [f"concept_{c}" for c in concepts]
+        heuristics = [self.graph.nodes[hid]['text']
+                      for hid in self._relevant_heuristic_ids(problem_type, concepts)]
+        self._heuristics_cache[cache_key] = heuristics
+        return list(heuristics)
 
+    def _relevant_heuristic_ids(self, problem_type: str, concepts: List[str]) -> List[str]:
+        """经反向索引取相关启发式节点id，按净得分降序。零图遍历。"""
+        relevant_heuristic_ids = set()
+        source_nodes = [f"problem_{problem_type}"] + [_concept_id(c) for c in concepts]
         for node in source_nodes:
-            if self.graph.has_node(node):
-                for successor in self.graph.successors(node):
-                    if self.graph.nodes[successor].get('type') == 'heuristic':
-                        relevant_heuristic_ids.add(successor)
-
-        # 排序：优先选择正面案例多、负面案例少的启发式策略
-        sorted_heuristics = sorted(
-            list(relevant_heuristic_ids),
-            key=lambda hid: self.graph.nodes[hid].get('positive_count', 0) - self.graph.nodes[hid].get('negative_count',
-                                                                                                       0),
-            reverse=True
-        )
+            relevant_heuristic_ids.update(self._heuristics_by_source.get(node, ()))
 
-        return [self.graph.nodes[hid]['text'] for hid in sorted_heuristics]
+        # 排序：优先选择正面案例多、负面案例少的启发式策略。
+        # 集合较大时走numpy的C级argsort；小集合上Python sorted更划算
+        ids = list(relevant_heuristic_ids)
+        if np is not None and len(ids) >= 32:
+            scores = np.fromiter((self._heuristic_score.get(hid, 0) for hid in ids),
+                                 dtype=np.int32, count=len(ids))
+            order = np.argsort(-scores, kind='stable')
+            return [ids[i] for i in order]
+        return sorted(ids, key=self._heuristic_score.get, reverse=True)
 
     def retrieve_relevant_experience(self, task_analysis: Dict) -> Dict:
         """检索相关的启发式策略和成功的协作模式。"""
+        cache_key = (task_analysis.get('task_type', 'generic'),
+                     tuple(task_analysis.get('knowledge_domains', [])))
+        cached = self._retrieval_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         heuristics = self.retrieve_relevant_heuristics(task_analysis)
 
-        # (可选) 未来可加入检索与这些启发式策略相关的成功模式
+        # 同一次检索顺带取该问题类型下的成功协作模式（单遍successor扫描），
+        # 不再为模式单独遍历一次图；最多取3条以免撑爆提示词
+        problem_node = f"problem_{task_analysis.get('task_type', 'generic')}"
+        patterns = []
+        for successor in self.graph.successors(problem_node):
+            if self.graph.nodes[successor].get('type') == 'successful_pattern':
+                patterns.append(self.graph.nodes[successor]['plan'])
+                if len(patterns) >= 3:
+                    break
 
         if heuristics:
             print(f"  [记忆模块] 检索到 {len(heuristics)} 条相关的解题原则/启发式策略。")
 
-        return {
+        experience = {
             "retrieved_heuristics": heuristics,
-            "successful_patterns": []  # 简化：目前主要依赖启发式策略
-        }
\ No newline at end of file
+            "successful_patterns": patterns
+        }
+        self._retrieval_cache[cache_key] = experience
+        return experience
\ No newline at end of file
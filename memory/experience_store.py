@@ -1,30 +1,74 @@
-# memory/experience_store.py
-import os
-import json
-from typing import Dict, Any, List
-
-class ExperienceStore:
-    def __init__(self, path: str = "results/experience.json"):
-        self.path = path
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        if not os.path.exists(self.path):
-            with open(self.path, "w") as f:
-                json.dump([], f)
-
-    async def store_experience(self, experience: Dict[str, Any]) -> None:
-        """将经验追加存储到本地JSON文件"""
-        data = await self.load_all_experiences()
-        data.append(experience)
-        try:
-            with open(self.path, "w", encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error storing experience: {e}")
-
-    async def load_all_experiences(self) -> List[Dict[str, Any]]:
-        """加载所有存储的经验"""
-        try:
-            with open(self.path, "r", encoding='utf-8') as f:
-                return json.load(f)
-        except (IOError, json.JSONDecodeError):
-            return []
\ No newline at end of file
+# memory/experience_store.py
+import asyncio
+import atexit
+import os
+import json
+from typing import Dict, Any, List
+
+from utils.json_utils import dump_json, loads
+
+class ExperienceStore:
+    def __init__(self, path: str = "results/experience.json", flush_threshold: int = 16):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not os.path.exists(self.path):
+            open(self.path, "w").close()
+        else:
+            self._migrate_array_file()
+        # 追加缓冲：攒够一批记录再做一次写盘，进程退出时兜底冲刷
+        self.flush_threshold = flush_threshold
+        self._buffer: List[str] = []
+        # 全量经验的进程内缓存：文件只在首次访问解析一次，
+        # 此后读走内存、写只追加，磁盘读成本从O(N)降到O(1)
+        self._cache: List[Dict[str, Any]] = None
+        atexit.register(self.flush)
+
+    def _ensure_cache(self) -> None:
+        if self._cache is not None:
+            return
+        try:
+            with open(self.path, "r", encoding='utf-8') as f:
+                self._cache = [loads(line) for line in f if line.strip()]
+        except (IOError, ValueError, json.JSONDecodeError):
+            self._cache = []
+
+    def _migrate_array_file(self) -> None:
+        """旧格式迁移：整文件JSON数组一次性重写为按行追加的JSON Lines"""
+        with open(self.path, "r", encoding='utf-8') as f:
+            content = f.read()
+        if not content.lstrip().startswith("["):
+            return
+        try:
+            data = loads(content)
+        except (ValueError, json.JSONDecodeError):
+            return
+        with open(self.path, "w", encoding='utf-8') as f:
+            for entry in data:
+                f.write(dump_json(entry) + "\n")
+
+    async def store_experience(self, experience: Dict[str, Any]) -> None:
+        """缓冲一条经验记录，攒满一批后以单次JSON Lines追加落盘"""
+        try:
+            if self._cache is None:
+                await asyncio.to_thread(self._ensure_cache)
+            self._cache.append(experience)
+            self._buffer.append(dump_json(experience))
+            if len(self._buffer) >= self.flush_threshold:
+                # 批量写盘放到线程池，事件循环在磁盘I/O期间继续跑其他协程
+                await asyncio.to_thread(self.flush)
+        except Exception as e:
+            print(f"Error storing experience: {e}")
+
+    def flush(self) -> None:
+        """把缓冲的记录一次性追加写入文件（进程退出时由atexit调用）"""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        with open(self.path, "a", encoding='utf-8') as f:
+            f.write("\n".join(batch) + "\n")
+
+    async def load_all_experiences(self) -> List[Dict[str, Any]]:
+        """返回所有经验（内存缓存含未落盘的缓冲记录；首次的文件解析在线程池执行）"""
+        if self._cache is None:
+            await asyncio.to_thread(self._ensure_cache)
+        return list(self._cache)
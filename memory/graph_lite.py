@@ -0,0 +1,117 @@
+# memory/graph_lite.py
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class _NodeView:
+    """节点视图：兼容 nx 风格的 graph.nodes[id] / graph.nodes(data=True) 用法"""
+
+    def __init__(self, nodes: Dict[str, Dict[str, Any]]):
+        self._nodes = nodes
+
+    def __getitem__(self, node_id: str) -> Dict[str, Any]:
+        return self._nodes[node_id]
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __call__(self, data: bool = False):
+        if data:
+            return list(self._nodes.items())
+        return list(self._nodes)
+
+    def get(self, node_id: str, default=None):
+        return self._nodes.get(node_id, default)
+
+
+class LiteGraph:
+    """
+    轻量有向图：两个普通字典（节点属性 + 邻接表）。
+    经验图只有三类节点、一跳successor查询和简单计数打分，
+    不需要NetworkX的全套结构——省去每节点succ/pred/attr三个字典的
+    开销、整个networkx的导入时间，以及node_link_data的转换成本。
+    """
+
+    def __init__(self):
+        self._node: Dict[str, Dict[str, Any]] = {}
+        self._adj: Dict[str, List[str]] = {}
+
+    @property
+    def nodes(self) -> _NodeView:
+        return _NodeView(self._node)
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self._node
+
+    def add_node(self, node_id: str, **attrs) -> None:
+        self._node.setdefault(node_id, {}).update(attrs)
+        self._adj.setdefault(node_id, [])
+
+    def add_edge(self, source: str, target: str) -> None:
+        self.add_node(source)
+        self.add_node(target)
+        if target not in self._adj[source]:
+            self._adj[source].append(target)
+
+    def successors(self, node_id: str) -> Iterator[str]:
+        return iter(self._adj.get(node_id, ()))
+
+    def edges(self) -> Iterator[Tuple[str, str]]:
+        for source, targets in self._adj.items():
+            for target in targets:
+                yield source, target
+
+    def relabel_nodes(self, mapping: Dict[str, str]) -> None:
+        """按映射重命名节点并重写邻接表；目标id已存在时合并计数属性"""
+        if not mapping:
+            return
+        new_node: Dict[str, Dict[str, Any]] = {}
+        for node_id, attrs in self._node.items():
+            new_id = mapping.get(node_id, node_id)
+            if new_id in new_node:
+                existing = new_node[new_id]
+                for key in ("positive_count", "negative_count"):
+                    if key in attrs or key in existing:
+                        existing[key] = existing.get(key, 0) + attrs.get(key, 0)
+            else:
+                new_node[new_id] = dict(attrs)
+        new_adj: Dict[str, List[str]] = {}
+        for source, targets in self._adj.items():
+            merged = new_adj.setdefault(mapping.get(source, source), [])
+            for target in targets:
+                new_target = mapping.get(target, target)
+                if new_target not in merged:
+                    merged.append(new_target)
+        for node_id in new_node:
+            new_adj.setdefault(node_id, [])
+        self._node, self._adj = new_node, new_adj
+
+    def to_dict(self) -> Dict[str, Any]:
+        """直接可序列化的形式：{"nodes": 属性字典, "adj": 邻接表}"""
+        return {"nodes": self._node, "adj": self._adj}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LiteGraph":
+        graph = cls()
+        graph._node = {node_id: dict(attrs) for node_id, attrs in data.get("nodes", {}).items()}
+        graph._adj = {node_id: list(targets) for node_id, targets in data.get("adj", {}).items()}
+        for node_id in graph._node:
+            graph._adj.setdefault(node_id, [])
+        return graph
+
+    @classmethod
+    def from_node_link_data(cls, data: Dict[str, Any]) -> "LiteGraph":
+        """从networkx的node_link_data格式迁移旧图文件"""
+        graph = cls()
+        for node in data.get("nodes", []):
+            attrs = dict(node)
+            node_id = attrs.pop("id")
+            graph.add_node(node_id, **attrs)
+        for link in data.get("links", []):
+            graph.add_edge(link["source"], link["target"])
+        return graph
@@ -1,24 +1,82 @@
+import asyncio
 import os
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from utils.json_utils import dump_json, loads
 
 class KnowledgeBase:
     def __init__(self, path: str = "results/knowledge.json"):
         self.path = path
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
         if not os.path.exists(self.path):
-            with open(self.path, "w") as f:
-                json.dump([], f)
+            open(self.path, "w").close()
+        else:
+            self._migrate_array_file()
+
+    def _migrate_array_file(self) -> None:
+        """旧格式迁移：整文件JSON数组一次性重写为按行追加的JSON Lines"""
+        with open(self.path, "r", encoding='utf-8') as f:
+            content = f.read()
+        if not content.lstrip().startswith("["):
+            return
+        try:
+            data = loads(content)
+        except (ValueError, json.JSONDecodeError):
+            return
+        with open(self.path, "w", encoding='utf-8') as f:
+            for entry in data:
+                f.write(dump_json(entry) + "\n")
+
+    def _load_entries(self) -> list:
+        """按行读取全部知识条目"""
+        with open(self.path, "r", encoding='utf-8') as f:
+            return [loads(line) for line in f if line.strip()]
 
     async def add_knowledge(self, task_type: str, knowledge: Dict[str, Any]) -> None:
-        """将知识追加存储到本地JSON文件"""
+        """将知识以JSON Lines格式追加到本地文件（O(1)，不再重写全量历史）"""
+        # 写盘放到线程池，不让追加I/O阻塞事件循环
+        await asyncio.to_thread(self._append_entry,
+                                {"task_type": task_type, "knowledge": knowledge})
+
+    def _append_entry(self, entry: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding='utf-8') as f:
+            f.write(dump_json(entry) + "\n")
+
+    async def lookup_similar(self, task_description: str,
+                             min_similarity: float = 0.8) -> Optional[Dict[str, Any]]:
+        """
+        按词集Jaccard相似度检索与给定任务描述最接近的历史知识条目。
+        相似度达到阈值时返回 {"similarity": ..., "knowledge": ...}，否则返回None。
+        文件读取与扫描在线程池执行，可与并发的LLM调用重叠。
+        """
+        return await asyncio.to_thread(self._lookup_similar_sync, task_description, min_similarity)
+
+    def _lookup_similar_sync(self, task_description: str,
+                             min_similarity: float) -> Optional[Dict[str, Any]]:
         try:
-            with open(self.path, "r") as f:
-                data = json.load(f)
+            data = self._load_entries()
         except Exception:
-            data = []
-        data.append({"task_type": task_type, "knowledge": knowledge})
-        with open(self.path, "w") as f:
-            json.dump(data, f, indent=2)
+            return None
+
+        query_tokens = set(task_description.lower().split())
+        if not query_tokens:
+            return None
+
+        best_entry = None
+        best_similarity = 0.0
+        for entry in data:
+            stored_desc = str(entry.get("knowledge", {}).get("task_description", ""))
+            tokens = set(stored_desc.lower().split())
+            if not tokens:
+                continue
+            similarity = len(query_tokens & tokens) / len(query_tokens | tokens)
+            if similarity > best_similarity:
+                best_entry = entry
+                best_similarity = similarity
+
+        if best_entry is not None and best_similarity >= min_similarity:
+            return {"similarity": best_similarity, "knowledge": best_entry["knowledge"]}
+        return None
 
 
@@ -261,19 +261,72 @@ class ApiManager:
 
 
 
+import hashlib
+import json
 import os
-from typing import Dict, Any, List, Optional
+import warnings
+from collections import OrderedDict
+from functools import partial
+from typing import AsyncIterator, Dict, Any, List, Optional
 
 import httpx
 import asyncio
 
+from aiolimiter import AsyncLimiter
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
+
+from utils.http_client import get_http_client
+from utils.json_utils import loads as json_loads
+
+# httpx 的 json= 参数走stdlib json；LLM载荷里消息内容很大，
+# orjson的C实现编解码快数倍。不可用时退回stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _encode_payload(payload: Dict[str, Any]) -> bytes:
+    """把请求体序列化为bytes，优先orjson（省去str中转和纯Python编码）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+class RetryableApiError(Exception):
+    """可重试的上游错误（429/5xx），可携带服务端建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# 瞬时故障：限流和网关/上游错误，重试通常可恢复
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+def _wait_with_retry_after(retry_state):
+    """服务端给出Retry-After时优先遵循，否则按带抖动的指数退避"""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    if isinstance(exc, RetryableApiError) and exc.retry_after:
+        return min(exc.retry_after, 60.0)
+    return wait_exponential_jitter(initial=1, max=60)(retry_state)
+
+
+retry_on_api_error = retry(
+    wait=_wait_with_retry_after,
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type((httpx.TransportError, RetryableApiError)),
+    reraise=True,
+)
+
 
 class ApiManager:
     """
     管理与云雾 yunwu.ai LLM 接口的异步交互
     """
 
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], client: Optional[httpx.AsyncClient] = None):
         """初始化 API 管理器"""
         # 1. API Key：优先从环境变量 YUNWU_API_KEY 获取，再回退到 config
         self.api_key = os.environ.get("YUNWU_API_KEY") or config.get("yunwu_api_key", "")
@@ -286,29 +339,113 @@ class ApiManager:
         # yunwu.ai 的 base_url 是 https://yunwu.ai
         # 真正的请求端点需要在此基础上拼接，例如 /v1/chat/completions
         self.base_url = config.get("yunwu_base_url", "https://yunwu.ai")
+        # 请求头和端点URL对实例是常量，构造时算好，热路径上不再
+        # 每次请求重建字典、格式化f-string
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        self._endpoint = f"{self.base_url}/v1/chat/completions"
         self.default_model = config.get("default_model")
         self.timeout = config.get("timeout", 30)  # 增加一个默认超时时间
         self.default_max_tokens = config.get("max_tokens")
         self.default_temperature = config.get("temperature")
 
-        # 3. 创建一个全局的 AsyncClient，可复用连接池
-        self._client = httpx.AsyncClient(timeout=self.timeout)
+        # 在途请求准入控制：无界并发会瞬间打满连接池并触发上游429，
+        # 重试反而把延迟串行化。不用Semaphore而用计数器+Condition，
+        # 是为了能在运行中安全调整上限（Semaphore运行期改容量是未定义行为），
+        # 外层控制器可据429率收缩、成功后再放宽。
+        self._active_requests = 0
+        self._max_concurrency = config.get("max_concurrency", 20)
+        self._admission = asyncio.Condition()
+
+        # 主动限速：按上游配额自我调速比"被429打回再退避"便宜——
+        # 退避是纯等待浪费，令牌桶把等待变成零成本的排期。
+        # 桶速率略低于名义配额，抵消时钟偏差。config 未配置时不限速。
+        rate_per_min = config.get("rate_per_min")
+        self._limiter = AsyncLimiter(rate_per_min / 60.0, 1.0) if rate_per_min else None
+
+        # 相同prompt在重试和并行子任务中反复出现。LRU按载荷哈希缓存
+        # 已完成/在途的Future：命中已完成的直接零RTT返回，命中在途的
+        # 等同一个Future（请求合并——两个并发的相同调用只打一次上游）。
+        # 默认只缓存temperature=0的确定性调用，采样调用需显式开启
+        self._completion_cache: "OrderedDict[bytes, asyncio.Future]" = OrderedDict()
+        self._completion_cache_size = config.get("completion_cache_size", 256)
+        self._cache_sampled = bool(config.get("cache_sampled_completions", False))
+
+        # 3. 复用共享的 AsyncClient，让TCP/TLS握手在所有Agent间摊销。
+        # 共享客户端按事件循环键控、请求时再解析，多次 asyncio.run 之间
+        # 不会踩到绑定在已关闭循环上的连接池。
+        # 也允许注入自定义客户端（例如测试时），此时由本实例负责关闭。
+        if client is not None:
+            self._injected_client = client
+            self._owns_client = True
+        else:
+            self._injected_client = None
+            self._owns_client = False
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        """注入的客户端优先；否则取当前事件循环对应的共享客户端"""
+        if self._injected_client is not None:
+            return self._injected_client
+        return get_http_client()
+
+    async def _acquire_slot(self) -> None:
+        """等待直到在途请求数低于并发上限"""
+        async with self._admission:
+            await self._admission.wait_for(
+                lambda: self._active_requests < self._max_concurrency)
+            self._active_requests += 1
+
+    async def _release_slot(self) -> None:
+        async with self._admission:
+            self._active_requests -= 1
+            self._admission.notify(1)
+
+    async def set_concurrency(self, n: int) -> None:
+        """运行中调整并发上限；放宽时唤醒所有等待者重新检查条件"""
+        async with self._admission:
+            self._max_concurrency = n
+            self._admission.notify_all()
 
+    @retry_on_api_error
     async def _call_yunwu(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """内部：发起异步 HTTP POST 请求到 yunwu.ai 接口"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        """内部：发起异步 HTTP POST 请求到 yunwu.ai 接口（瞬时故障自动退避重试）"""
+        headers = self._headers
+        endpoint_url = self._endpoint
 
-        # 修正请求的 URL，需要指向具体的 chat/completions 端点
-        endpoint_url = f"{self.base_url}/v1/chat/completions"
+        # 请求体用orjson预先编码，headers已含Content-Type: application/json
+        body = _encode_payload(payload)
 
-        response = await self._client.post(endpoint_url, json=payload, headers=headers)
-
-        # 抛出 HTTP 错误状态码 (e.g., 4xx, 5xx)
+        await self._acquire_slot()
+        try:
+            if self._limiter is not None:
+                # POST必须留在limiter的with块内，先释放令牌再发请求会失去限速意义
+                async with self._limiter:
+                    response = await self._client.post(endpoint_url, content=body,
+                                                       headers=headers, timeout=self.timeout)
+            else:
+                # 超时是每个 ApiManager 的配置，客户端是共享的，因此按请求传入
+                response = await self._client.post(endpoint_url, content=body, headers=headers,
+                                                   timeout=self.timeout)
+        finally:
+            await self._release_slot()
+
+        # 限流/网关错误转成可重试异常交给tenacity，其余4xx直接抛出
+        if response.status_code in _RETRYABLE_STATUS:
+            try:
+                retry_after = float(response.headers.get("retry-after", 0)) or None
+            except ValueError:
+                retry_after = None
+            raise RetryableApiError(
+                f"上游返回 {response.status_code}: {response.text[:200]}",
+                retry_after=retry_after,
+            )
+        # 抛出 HTTP 错误状态码 (e.g., 4xx)
         response.raise_for_status()
-        return response.json()
+        # orjson优先解析响应字节，退回stdlib由json_utils.loads处理
+        return json_loads(response.content)
 
     async def generate_completion(
             self,
@@ -358,8 +495,39 @@ class ApiManager:
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
 
-        data = await self._call_yunwu(payload)
+        if temperature != 0 and not self._cache_sampled:
+            return self._extract_content(await self._call_yunwu(payload))
+
+        key = hashlib.blake2b(_encode_payload(payload), digest_size=16).digest()
+        future = self._completion_cache.get(key)
+        if future is not None:
+            self._completion_cache.move_to_end(key)
+            # shield保证等待方被取消时不连带取消共享的在途请求
+            return await asyncio.shield(future)
 
+        future = asyncio.get_running_loop().create_future()
+        self._completion_cache[key] = future
+        while len(self._completion_cache) > self._completion_cache_size:
+            self._completion_cache.popitem(last=False)
+        try:
+            content = self._extract_content(await self._call_yunwu(payload))
+        except BaseException as e:
+            # 失败不缓存；同步到等待同一Future的合并请求。
+            # CancelledError（BaseException）也必须了结Future：发起方被取消时
+            # 若把pending的Future留在缓存里，后续相同请求会永远挂在shield等待上
+            self._completion_cache.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # 标记已取回，避免"exception never retrieved"告警
+            raise
+        future.set_result(content)
+        return content
+
+    @staticmethod
+    def _extract_content(data: Dict[str, Any]) -> str:
+        """从OpenAI兼容的响应中取出首个choice的文本内容"""
         # yunwu.ai API 的返回格式与 OpenAI 兼容
         try:
             # 检查返回的数据结构是否包含预期的键
@@ -371,21 +539,154 @@ class ApiManager:
         except (KeyError, IndexError, TypeError):
             raise RuntimeError(f"解析响应时出错，响应数据: {data!r}")
 
+    async def stream_chat_completion(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            temperature: Optional[float] = None,
+            max_tokens: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """
+        流式生成聊天完成，SSE增量一到就逐段yield。
+        下游可以边收边处理（首token延迟只有一个RTT），不必等完整回复；
+        提前退出迭代即中止HTTP流、取消服务端继续生成。
+        准入槽位在生成器finally中释放，break/aclose都能正确归还。
+        """
+        model = model or self.default_model
+        temperature = temperature if temperature is not None else self.default_temperature
+        max_tokens = max_tokens if max_tokens is not None else self.default_max_tokens
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+        }
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+
+        headers = self._headers
+        endpoint_url = self._endpoint
+
+        body = _encode_payload(payload)
+
+        await self._acquire_slot()
+        try:
+            async with self._client.stream("POST", endpoint_url, content=body, headers=headers,
+                                           timeout=self.timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data_str = line[len("data:"):].strip()
+                    if data_str == "[DONE]":
+                        break
+                    try:
+                        data = json_loads(data_str)
+                        delta = data["choices"][0].get("delta", {}).get("content")
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        continue
+                    if delta:
+                        yield delta
+        finally:
+            await self._release_slot()
+
+    async def generate_chat_completion_stream(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            temperature: Optional[float] = None,
+            max_tokens: Optional[int] = None,
+            stop_regex=None,
+    ) -> str:
+        """
+        流式生成聊天完成，逐增量累积文本。
+        stop_regex 命中累积缓冲时立即中断流（关闭响应即取消服务端继续生成），
+        适合"结构化结束标记已出现，后续token无用"的场景（如 \\boxed{...}）。
+        """
+        chunks: List[str] = []
+        buffer = ""
+        stream = self.stream_chat_completion(
+            messages, model=model, temperature=temperature, max_tokens=max_tokens)
+        async for delta in stream:
+            chunks.append(delta)
+            if stop_regex is not None:
+                buffer += delta
+                if stop_regex.search(buffer):
+                    # 结束标记已经出现，提前退出；关闭生成器即中止HTTP流
+                    await stream.aclose()
+                    break
+        return "".join(chunks)
+
     async def batch_generate(self, prompts: List[str], model=None, temperature=None, max_tokens=None) -> List[str]:
         """
-        使用 asyncio.gather 并行处理批量生成请求，效率更高
+        使用 asyncio.gather 并行处理批量生成请求，效率更高。
+        在途并发由 _call_yunwu 处的准入控制统一限制在 max_concurrency 以内。
         """
-        tasks = [
-            self.generate_completion(prompt, model=model, temperature=temperature, max_tokens=max_tokens)
-            for prompt in prompts
-        ]
+        # kwargs字典只构造一次（partial对象），map在C层迭代，
+        # 大批量下省去每条提示一次的关键字参数打包
+        generate = partial(self.generate_completion,
+                           model=model, temperature=temperature, max_tokens=max_tokens)
 
         # gather 会并发执行所有任务
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*map(generate, prompts), return_exceptions=True)
 
         # 处理可能出现的异常
         return [str(res) if not isinstance(res, Exception) else f"[Error: {res}]" for res in results]
 
+    async def batch_generate_grouped(self, prompts: List[str], group_size: int = 4,
+                                     model=None, temperature=None, max_tokens=None) -> List[str]:
+        """
+        把多个提示合并进单次上游请求的微批量版本。
+        每 group_size 个提示拼成一条带编号分隔标记的用户消息，要求模型
+        逐段作答并以相同标记分隔，一次HTTP往返换回一组结果——省去
+        按条请求的TLS/HTTP开销和重复系统提示的token。
+        模型未按标记切分时该组自动回退到逐条 batch_generate。
+        适合提示彼此独立、单条回答较短的场景；group_size 需按模型实测调优。
+        """
+        boundary = "---PROMPT-BOUNDARY---"
+        groups = [prompts[i:i + group_size] for i in range(0, len(prompts), group_size)]
+
+        async def run_group(chunk: List[str]) -> List[str]:
+            if len(chunk) == 1:
+                return [await self.generate_completion(
+                    chunk[0], model=model, temperature=temperature, max_tokens=max_tokens)]
+            joined = f"\n{boundary}\n".join(chunk)
+            prompt = (
+                f"Below are {len(chunk)} independent prompts separated by the line "
+                f"\"{boundary}\". Answer each one in order, and separate your answers "
+                f"with the exact same line \"{boundary}\". Output nothing else.\n\n{joined}"
+            )
+            try:
+                combined = await self.generate_completion(
+                    prompt, model=model, temperature=temperature, max_tokens=max_tokens)
+            except Exception as e:
+                return [f"[Error: {e}]"] * len(chunk)
+            parts = [part.strip() for part in combined.split(boundary)]
+            if len(parts) == len(chunk):
+                return parts
+            # 切分数对不上说明模型没遵守标记协议，该组退回逐条请求
+            return await self.batch_generate(
+                chunk, model=model, temperature=temperature, max_tokens=max_tokens)
+
+        group_results = await asyncio.gather(*[run_group(chunk) for chunk in groups])
+        return [res for group in group_results for res in group]
+
     async def close(self):
-        """关闭 AsyncClient 连接池"""
-        await self._client.aclose()
+        """关闭 AsyncClient 连接池（共享客户端由 utils.http_client.close_http_client 统一关闭）"""
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def __aenter__(self) -> "ApiManager":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    def __del__(self):
+        # 兜底提醒：注入的客户端未关闭会泄漏连接池里的保活socket
+        if getattr(self, "_owns_client", False) and self._injected_client is not None \
+                and not self._injected_client.is_closed:
+            warnings.warn("ApiManager was garbage-collected without close(); "
+                          "use 'async with ApiManager(...)' or call close() explicitly.",
+                          ResourceWarning)
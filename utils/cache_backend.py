@@ -0,0 +1,69 @@
+# utils/cache_backend.py
+from typing import Any, Dict, Optional
+
+# Redis后端是可选依赖，缺少时缓存退化为仅进程内
+try:
+    import redis.asyncio as aioredis
+    _REDIS_AVAILABLE = True
+except ImportError:
+    _REDIS_AVAILABLE = False
+
+
+class RedisCacheBackend:
+    """
+    基于Redis的跨进程响应缓存后端。
+    进程内缓存在多worker部署下各自为政，每个worker都要重新学习相同的
+    响应；把精确匹配缓存落到Redis后，命中对整个集群生效。
+    键带模型版本前缀，换模型时旧缓存自然失效。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or {}
+        self.url = self.config.get("redis_cache_url", "")
+        self.ttl = self.config.get("redis_cache_ttl", 3600)
+        self.key_prefix = f"metaagent:{self.config.get('default_model', 'unknown')}:"
+        self.enabled = bool(self.url) and _REDIS_AVAILABLE
+        self._client = None
+
+    def _get_client(self):
+        """惰性创建共享连接池的Redis客户端"""
+        if self._client is None:
+            self._client = aioredis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def get(self, key: str) -> Optional[str]:
+        """读取缓存条目，Redis不可达时静默返回None"""
+        if not self.enabled:
+            return None
+        try:
+            return await self._get_client().get(self.key_prefix + key)
+        except Exception as e:
+            print(f"警告: Redis缓存读取失败: {e}")
+            return None
+
+    async def setex(self, key: str, value: str) -> None:
+        """写入带TTL的缓存条目，Redis不可达时静默跳过"""
+        if not self.enabled:
+            return
+        try:
+            await self._get_client().setex(self.key_prefix + key, self.ttl, value)
+        except Exception as e:
+            print(f"警告: Redis缓存写入失败: {e}")
+
+    async def close(self) -> None:
+        """关闭Redis连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 进程级单例
+_CACHE_BACKEND: Optional[RedisCacheBackend] = None
+
+
+def get_cache_backend(config: Optional[Dict[str, Any]] = None) -> RedisCacheBackend:
+    """获取进程级的Redis缓存后端单例"""
+    global _CACHE_BACKEND
+    if _CACHE_BACKEND is None:
+        _CACHE_BACKEND = RedisCacheBackend(config)
+    return _CACHE_BACKEND
@@ -0,0 +1,64 @@
+# utils/dataset_utils.py
+import os
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from utils.http_client import get_http_client
+from utils.json_utils import loads
+
+
+async def download_file(url: str, dest_path: str, chunk_size: int = 1 << 16) -> None:
+    """
+    异步流式下载文件到 dest_path。
+    复用进程级共享的httpx客户端，分块写入避免整个文件驻留内存；
+    先写 .part 临时文件再原子改名，中断的下载不会留下半截数据集。
+    """
+    part_path = dest_path + ".part"
+    client = get_http_client()
+    try:
+        async with client.stream("GET", url, follow_redirects=True) as response:
+            response.raise_for_status()
+            with open(part_path, "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    f.write(chunk)
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+
+@lru_cache(maxsize=8)
+def _load_jsonl_cached(path: str, num_problems: Optional[int], mtime_ns: int) -> tuple:
+    problems = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if num_problems is not None and len(problems) >= num_problems:
+                break
+            if line.strip():
+                problems.append(loads(line))
+    return tuple(problems)
+
+
+@lru_cache(maxsize=8)
+def _load_json_values_cached(path: str, num_problems: Optional[int], mtime_ns: int) -> tuple:
+    with open(path, "r", encoding="utf-8") as f:
+        data = loads(f.read())
+    if num_problems is not None:
+        return tuple(islice(data.values(), num_problems))
+    return tuple(data.values())
+
+
+def load_jsonl(path: str, num_problems: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    加载JSON Lines数据集，按 (路径, 数量, mtime) 做进程内LRU缓存：
+    同一评测进程里的重复加载（进化+测试两阶段、参数扫描）直接命中内存，
+    文件被修改时mtime变化、缓存自然失效。
+    """
+    return list(_load_jsonl_cached(path, num_problems, os.stat(path).st_mtime_ns))
+
+
+def load_json_values(path: str, num_problems: Optional[int] = None) -> List[Dict[str, Any]]:
+    """加载"键->记录"结构的JSON数据集的值列表，缓存策略同 load_jsonl。"""
+    return list(_load_json_values_cached(path, num_problems, os.stat(path).st_mtime_ns))
@@ -1,204 +1,280 @@
-# utils/evaluation.py
-from typing import Dict, Any, List, Optional
-import json
-import subprocess
-import os
-import tempfile
-
-
-class CodeEvaluator:
-    """
-    代码评估工具，用于评估生成的代码质量
-    """
-
-    async def evaluate_code(self,
-                            code: str,
-                            language: str,
-                            test_cases: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        """评估代码的正确性和质量"""
-        results = {
-            "syntax_valid": False,
-            "execution_results": [],
-            "passed_tests": 0,
-            "total_tests": 0,
-            "errors": []
-        }
-
-        # 检查语法
-        syntax_result = await self._check_syntax(code, language)
-        results["syntax_valid"] = syntax_result["valid"]
-        if not syntax_result["valid"]:
-            results["errors"].append(syntax_result["error"])
-            return results
-
-        # 如果没有测试用例，只返回语法检查结果
-        if not test_cases:
-            return results
-
-        # 执行测试用例
-        results["total_tests"] = len(test_cases)
-
-        for i, test_case in enumerate(test_cases):
-            test_result = await self._execute_test(code, language, test_case)
-            results["execution_results"].append(test_result)
-
-            if test_result["passed"]:
-                results["passed_tests"] += 1
-            else:
-                results["errors"].append(f"Test case {i + 1} failed: {test_result['error']}")
-
-        return results
-
-    async def _check_syntax(self, code: str, language: str) -> Dict[str, Any]:
-        """检查代码语法"""
-        result = {"valid": False, "error": ""}
-
-        with tempfile.NamedTemporaryFile(suffix=self._get_extension(language), mode="w", delete=False) as temp:
-            temp.write(code)
-            temp_path = temp.name
-
-        try:
-            if language.lower() == "python":
-                # Python语法检查
-                process = subprocess.run(
-                    ["python", "-m", "py_compile", temp_path],
-                    capture_output=True,
-                    text=True
-                )
-
-                if process.returncode != 0:
-                    result["error"] = process.stderr
-                else:
-                    result["valid"] = True
-
-            elif language.lower() == "javascript":
-                # JavaScript语法检查
-                process = subprocess.run(
-                    ["node", "--check", temp_path],
-                    capture_output=True,
-                    text=True
-                )
-
-                if process.returncode != 0:
-                    result["error"] = process.stderr
-                else:
-                    result["valid"] = True
-            else:
-                # 其他语言暂不支持
-                result["valid"] = True
-                result["error"] = f"Syntax checking for {language} is not implemented"
-        except Exception as e:
-            result["error"] = str(e)
-        finally:
-            os.unlink(temp_path)
-
-        return result
-
-    async def _execute_test(self, code: str, language: str, test_case: Dict[str, Any]) -> Dict[str, Any]:
-        """执行测试用例"""
-        result = {
-            "input": test_case.get("input", ""),
-            "expected_output": test_case.get("expected_output", ""),
-            "actual_output": "",
-            "passed": False,
-            "error": ""
-        }
-
-        with tempfile.NamedTemporaryFile(suffix=self._get_extension(language), mode="w", delete=False) as temp:
-            # 组合代码和测试
-            if language.lower() == "python":
-                combined_code = f"{code}\n\n# Test case\n{test_case.get('test_code', '')}"
-            elif language.lower() == "javascript":
-                combined_code = f"{code}\n\n// Test case\n{test_case.get('test_code', '')}"
-            else:
-                combined_code = code
-
-            temp.write(combined_code)
-            temp_path = temp.name
-
-        try:
-            if language.lower() == "python":
-                # 执行Python代码
-                process = subprocess.run(
-                    ["python", temp_path],
-                    input=test_case.get("input", ""),
-                    capture_output=True,
-                    text=True
-                )
-
-                if process.returncode != 0:
-                    result["error"] = process.stderr
-                else:
-                    result["actual_output"] = process.stdout.strip()
-
-            elif language.lower() == "javascript":
-                # 执行JavaScript代码
-                process = subprocess.run(
-                    ["node", temp_path],
-                    input=test_case.get("input", ""),
-                    capture_output=True,
-                    text=True
-                )
-
-                if process.returncode != 0:
-                    result["error"] = process.stderr
-                else:
-                    result["actual_output"] = process.stdout.strip()
-            else:
-                # 其他语言暂不支持
-                result["error"] = f"Execution for {language} is not implemented"
-        except Exception as e:
-            result["error"] = str(e)
-        finally:
-            os.unlink(temp_path)
-
-        # 检查结果是否与预期相符
-        expected = test_case.get("expected_output", "").strip()
-        actual = result["actual_output"].strip()
-
-        if expected == actual:
-            result["passed"] = True
-        elif test_case.get("comparison_type") == "contains" and expected in actual:
-            result["passed"] = True
-        elif test_case.get("custom_validator"):
-            # 如果有自定义验证函数，尝试执行
-            try:
-                validator_code = test_case["custom_validator"]
-                with tempfile.NamedTemporaryFile(suffix=".py", mode="w", delete=False) as vtemp:
-                    vtemp.write(f"""
-def validate(expected, actual):
-{validator_code}
-
-result = validate({repr(expected)}, {repr(actual)})
-print(result)
-""")
-                    vtemp_path = vtemp.name
-
-                validator_process = subprocess.run(
-                    ["python", vtemp_path],
-                    capture_output=True,
-                    text=True
-                )
-
-                if validator_process.stdout.strip().lower() == "true":
-                    result["passed"] = True
-
-                os.unlink(vtemp_path)
-            except Exception as e:
-                result["error"] += f"\nValidator error: {str(e)}"
-
-        return result
-
-    def _get_extension(self, language: str) -> str:
-        """获取语言对应的文件扩展名"""
-        extensions = {
-            "python": ".py",
-            "javascript": ".js",
-            "java": ".java",
-            "c": ".c",
-            "cpp": ".cpp",
-            "go": ".go",
-            "ruby": ".rb",
-            "php": ".php"
-        }
-        return extensions.get(language.lower(), ".txt")
+# utils/evaluation.py
+from typing import Dict, Any, List, Optional
+import asyncio
+import json
+import sys
+import os
+
+# 常驻Python执行进程的源码：逐行读取JSON请求{"code","input"}，
+# 在干净命名空间里exec并捕获stdout，按行写回JSON结果。
+# 解释器只冷启动一次，摊销掉每个测试用例30-150ms的启动成本，
+# 也免去每个用例的临时文件创建/删除。
+_PY_WORKER_SOURCE = """\
+import contextlib, io, json, sys
+for line in sys.stdin:
+    try:
+        request = json.loads(line)
+    except ValueError:
+        continue
+    response = {"stdout": "", "error": ""}
+    captured = io.StringIO()
+    real_stdin = sys.stdin
+    sys.stdin = io.StringIO(request.get("input", ""))
+    try:
+        with contextlib.redirect_stdout(captured):
+            exec(compile(request["code"], "<agent>", "exec"), {"__name__": "__main__"})
+    except BaseException as e:
+        response["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        sys.stdin = real_stdin
+    response["stdout"] = captured.getvalue()
+    sys.stdout.write(json.dumps(response) + "\\n")
+    sys.stdout.flush()
+"""
+
+
+# 语言到文件扩展名的映射；模块级常量，不在每次调用时重建字典
+_EXTENSIONS = {
+    "python": ".py",
+    "javascript": ".js",
+    "java": ".java",
+    "c": ".c",
+    "cpp": ".cpp",
+    "go": ".go",
+    "ruby": ".rb",
+    "php": ".php",
+}
+
+
+class CodeEvaluator:
+    """
+    代码评估工具，用于评估生成的代码质量
+    """
+
+    def __init__(self):
+        # 常驻worker池：每个CPU核一个槽位，进程惰性启动。
+        # 队列里的None表示"槽位空闲但进程未启动"，取到时再spawn
+        self._pool_size = os.cpu_count() or 4
+        self._worker_pool: Optional[asyncio.Queue] = None
+        # 非Python路径仍逐例起子进程，用同样的并发上限防止进程风暴
+        self._test_sem = asyncio.Semaphore(self._pool_size)
+
+    @staticmethod
+    async def _run_subprocess(cmd: List[str], input_text: str = "",
+                              timeout: float = 30) -> Dict[str, Any]:
+        """
+        非阻塞地运行一次性子进程并收集输出。
+        subprocess.run会把整个事件循环挂住子进程的全部时长，
+        并发中的API调用和其他评估全部停摆；换成asyncio子进程后
+        HTTP与子进程I/O真正重叠。超时杀掉子进程，避免僵尸堆积。
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(input=input_text.encode()), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return {"returncode": -1, "stdout": "",
+                    "stderr": f"Timed out after {timeout}s"}
+        return {"returncode": proc.returncode,
+                "stdout": stdout.decode(errors="replace"),
+                "stderr": stderr.decode(errors="replace")}
+
+    async def _acquire_worker(self) -> asyncio.subprocess.Process:
+        if self._worker_pool is None:
+            self._worker_pool = asyncio.Queue()
+            for _ in range(self._pool_size):
+                self._worker_pool.put_nowait(None)
+        worker = await self._worker_pool.get()
+        if worker is None or worker.returncode is not None:
+            worker = await asyncio.create_subprocess_exec(
+                sys.executable, "-u", "-c", _PY_WORKER_SOURCE,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        return worker
+
+    async def _run_python(self, code: str, stdin_data: str,
+                          timeout: float = 30) -> Dict[str, str]:
+        """在常驻worker池中执行Python代码；超时或worker损坏时杀掉并归还空槽"""
+        worker = await self._acquire_worker()
+        request = json.dumps({"code": code, "input": stdin_data})
+        worker.stdin.write((request + "\n").encode())
+        try:
+            await worker.stdin.drain()
+            line = await asyncio.wait_for(worker.stdout.readline(), timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            worker.kill()
+            # 后台回收被杀的worker，不阻塞当前调用方；不wait会留僵尸进程
+            asyncio.ensure_future(worker.wait())
+            self._worker_pool.put_nowait(None)
+            return {"stdout": "", "error": f"Execution timed out after {timeout}s"}
+        if not line:
+            # worker意外退出（如exec的代码调用os._exit），归还空槽待重建
+            self._worker_pool.put_nowait(None)
+            return {"stdout": "", "error": "Worker process exited unexpectedly"}
+        self._worker_pool.put_nowait(worker)
+        return json.loads(line)
+
+    async def evaluate_code(self,
+                            code: str,
+                            language: str,
+                            test_cases: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """评估代码的正确性和质量"""
+        results = {
+            "syntax_valid": False,
+            "execution_results": [],
+            "passed_tests": 0,
+            "total_tests": 0,
+            "errors": []
+        }
+
+        # 检查语法
+        syntax_result = await self._check_syntax(code, language)
+        results["syntax_valid"] = syntax_result["valid"]
+        if not syntax_result["valid"]:
+            results["errors"].append(syntax_result["error"])
+            return results
+
+        # 如果没有测试用例，只返回语法检查结果
+        if not test_cases:
+            return results
+
+        # 执行测试用例：彼此独立，并发跑满worker池，
+        # 墙钟时间从 T*K 降到 T*ceil(K/核数)
+        results["total_tests"] = len(test_cases)
+
+        async def run_case(test_case: Dict[str, Any]) -> Dict[str, Any]:
+            async with self._test_sem:
+                return await self._execute_test(code, language, test_case)
+
+        test_results = await asyncio.gather(
+            *[run_case(tc) for tc in test_cases], return_exceptions=True)
+
+        for i, test_result in enumerate(test_results):
+            if isinstance(test_result, Exception):
+                test_result = {
+                    "input": test_cases[i].get("input", ""),
+                    "expected_output": test_cases[i].get("expected_output", ""),
+                    "actual_output": "",
+                    "passed": False,
+                    "error": str(test_result),
+                }
+            results["execution_results"].append(test_result)
+
+            if test_result["passed"]:
+                results["passed_tests"] += 1
+            else:
+                results["errors"].append(f"Test case {i + 1} failed: {test_result['error']}")
+
+        return results
+
+    async def _check_syntax(self, code: str, language: str) -> Dict[str, Any]:
+        """检查代码语法"""
+        result = {"valid": False, "error": ""}
+        lang = language.lower()
+
+        if lang == "python":
+            # Python语法检查在进程内完成：compile()和py_compile做同一件事，
+            # 但零子进程、零临时文件
+            try:
+                compile(code, "<agent>", "exec")
+                result["valid"] = True
+            except SyntaxError as e:
+                result["error"] = str(e)
+            return result
+
+        try:
+            if lang == "javascript":
+                # JavaScript语法检查：源码直接从stdin送入（node --check -），
+                # 免去临时文件的三次系统调用和Windows上的句柄竞争
+                process = await self._run_subprocess(["node", "--check", "-"], input_text=code)
+
+                if process["returncode"] != 0:
+                    result["error"] = process["stderr"]
+                else:
+                    result["valid"] = True
+            else:
+                # 其他语言暂不支持
+                result["valid"] = True
+                result["error"] = f"Syntax checking for {language} is not implemented"
+        except Exception as e:
+            result["error"] = str(e)
+
+        return result
+
+    async def _execute_test(self, code: str, language: str, test_case: Dict[str, Any]) -> Dict[str, Any]:
+        """执行测试用例"""
+        result = {
+            "input": test_case.get("input", ""),
+            "expected_output": test_case.get("expected_output", ""),
+            "actual_output": "",
+            "passed": False,
+            "error": ""
+        }
+        lang = language.lower()
+
+        if lang == "python":
+            # 在常驻worker里执行，免去每个用例的解释器冷启动和临时文件
+            combined_code = f"{code}\n\n# Test case\n{test_case.get('test_code', '')}"
+            outcome = await self._run_python(combined_code, test_case.get("input", ""))
+            if outcome["error"]:
+                result["error"] = outcome["error"]
+            else:
+                result["actual_output"] = outcome["stdout"].strip()
+            return self._finalize_result(result, test_case)
+
+        try:
+            if lang == "javascript":
+                # 执行JavaScript代码：源码经-e参数传入，stdin留给测试输入，
+                # 不再落临时文件
+                combined_code = f"{code}\n\n// Test case\n{test_case.get('test_code', '')}"
+                process = await self._run_subprocess(
+                    ["node", "-e", combined_code],
+                    input_text=test_case.get("input", ""))
+
+                if process["returncode"] != 0:
+                    result["error"] = process["stderr"]
+                else:
+                    result["actual_output"] = process["stdout"].strip()
+            else:
+                # 其他语言暂不支持
+                result["error"] = f"Execution for {language} is not implemented"
+        except Exception as e:
+            result["error"] = str(e)
+
+        return self._finalize_result(result, test_case)
+
+    def _finalize_result(self, result: Dict[str, Any], test_case: Dict[str, Any]) -> Dict[str, Any]:
+        """根据期望输出/包含匹配/自定义验证器判定测试是否通过"""
+        # 检查结果是否与预期相符；actual_output在赋值处已strip过，不再重复
+        expected = test_case.get("expected_output", "").strip()
+        actual = result["actual_output"]
+
+        if expected == actual:
+            result["passed"] = True
+        elif test_case.get("comparison_type") == "contains" and expected in actual:
+            result["passed"] = True
+        elif test_case.get("custom_validator"):
+            # 自定义验证函数在进程内exec执行：验证器只是比较两个字符串，
+            # 不值得第二次解释器冷启动（~100ms）加一个临时文件
+            try:
+                validator_code = test_case["custom_validator"]
+                namespace: Dict[str, Any] = {}
+                exec(f"def validate(expected, actual):\n{validator_code}", namespace)
+                result["passed"] = bool(namespace["validate"](expected, actual))
+            except Exception as e:
+                result["error"] += f"\nValidator error: {str(e)}"
+
+        return result
+
+    def _get_extension(self, language: str) -> str:
+        """获取语言对应的文件扩展名"""
+        return _EXTENSIONS.get(language.lower(), ".txt")
@@ -0,0 +1,69 @@
+# utils/http_client.py
+import asyncio
+import os
+from typing import Dict
+
+import httpx
+
+# httpx 的 HTTP/2 支持依赖可选的 h2 包
+try:
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+
+def _http2_enabled() -> bool:
+    """
+    是否启用HTTP/2多路复用。
+    HTTP/1.1下每个在途请求占用一条TCP连接，HTTP/2把所有并发请求
+    复用到一两条连接上，省掉TLS握手并压缩头部。
+    可通过环境变量 HTTPX_HTTP2_ENABLED=0/1 强制开关，默认在h2可用时启用。
+    """
+    override = os.environ.get("HTTPX_HTTP2_ENABLED")
+    if override is not None:
+        return override not in ("0", "false", "False") and _H2_AVAILABLE
+    return _H2_AVAILABLE
+
+# 按事件循环共享的 AsyncClient。
+# 每个Agent各自创建客户端会导致每次请求都重新进行TCP+TLS握手，
+# 共享一个带连接池的客户端可以让握手开销在所有Agent之间摊销；
+# 按当前事件循环键控，多次 asyncio.run（交互/测试场景）不会
+# 复用绑定在已关闭循环上的连接池。
+_CLIENTS: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def _current_loop() -> asyncio.AbstractEventLoop:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.get_event_loop()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """惰性创建并返回当前事件循环对应的共享 httpx.AsyncClient"""
+    loop = _current_loop()
+    client = _CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        # 顺手清掉已关闭事件循环遗留的条目
+        for stale_loop in [l for l in _CLIENTS if l.is_closed()]:
+            del _CLIENTS[stale_loop]
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get("HTTPX_MAX_CONNECTIONS", 200)),
+                max_keepalive_connections=int(os.environ.get("HTTPX_MAX_KEEPALIVE", 100)),
+                # 保活时间要盖过批次之间的空档，否则下一批又要重新握手
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(connect=5, read=120, write=30, pool=10),
+            http2=_http2_enabled(),
+        )
+        _CLIENTS[loop] = client
+    return client
+
+
+async def close_http_client() -> None:
+    """关闭当前事件循环的共享客户端，释放连接池（在进程退出时调用）"""
+    client = _CLIENTS.pop(_current_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
@@ -1,60 +1,140 @@
-import json
-import re
-from typing import Dict, Any, Optional, List, Union
-
-def extract_and_parse_json(text: str) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]:
-    """
-    从字符串中提取JSON对象或数组并进行解析。
-    能够处理JSON被包裹在Markdown代码块或被其他文本包围的情况。
-
-    Args:
-        text: 来自LLM的输入字符串。
-
-    Returns:
-        如果找到有效的JSON，则返回解析后的字典或列表，否则返回None。
-    """
-    if not isinstance(text, str):
-        return None
-
-    # 1. 尝试寻找被Markdown代码块包裹的JSON (e.g., ```json ... ```)
-    # 匹配对象 (e.g. {...}) 或数组 (e.g. [...])
-    match = re.search(r'```(?:json)?\s*([\[{].*?[\]}])\s*```', text, re.DOTALL)
-    if match:
-        json_str = match.group(1)
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            # 如果解析失败，继续尝试其他方法
-            pass
-
-    # 2. 如果没有Markdown块，寻找第一个 '{' 或 '[' 到最后一个 '}' 或 ']'
-    # 这对于从被文本包围的JSON中救援出来很有效
-    json_str = None
-    try:
-        # 优先匹配对象
-        start_brace = text.find('{')
-        end_brace = text.rfind('}')
-        if start_brace != -1 and end_brace != -1 and end_brace > start_brace:
-            json_str = text[start_brace:end_brace + 1]
-            return json.loads(json_str)
-
-        # 其次匹配数组
-        start_bracket = text.find('[')
-        end_bracket = text.rfind(']')
-        if start_bracket != -1 and end_bracket != -1 and end_bracket > start_bracket:
-            json_str = text[start_bracket:end_bracket + 1]
-            return json.loads(json_str)
-
-    except json.JSONDecodeError:
-        # 如果从提取的子字符串解析失败，继续
-        pass
-
-    # 3. 作为最后的手段，尝试直接解析整个字符串
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-
-    # 如果所有尝试都失败了，则返回None
-    print(f"警告: 无法从响应中解析JSON: {text[:500]}...")
+import json
+import re
+from typing import Dict, Any, Optional, List, Union
+
+# orjson 的C实现比stdlib json快3-10倍；不可用时退回stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Markdown代码块包裹的JSON。每次完成解析都会用到，模块导入时编译一次，
+# 不依赖re内部有界缓存（高churn下会被逐出、重复编译）
+_FENCE_RE = re.compile(r'```(?:json)?\s*([\[{].*?[\]}])\s*```', re.DOTALL)
+
+
+def loads(json_str: str) -> Union[Dict[str, Any], List[Any]]:
+    """优先用orjson解析，失败或不可用时退回stdlib json。"""
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_str)
+
+
+def dump_json(obj: Any, pretty: bool = False, sort_keys: bool = False) -> str:
+    """
+    将对象序列化为JSON字符串，优先使用orjson（C实现，长轨迹上快数倍）。
+    pretty=True 时输出两格缩进，与 json.dumps(indent=2) 一致；
+    sort_keys=True 时按键排序，用于内容哈希等需要规范形式的场景。
+    不可序列化的值统一退化为str。
+    """
+    if orjson is not None:
+        try:
+            option = orjson.OPT_INDENT_2 if pretty else 0
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, option=option, default=str).decode()
+        except TypeError:
+            pass
+    if pretty:
+        return json.dumps(obj, indent=2, default=str, sort_keys=sort_keys)
+    return json.dumps(obj, default=str, sort_keys=sort_keys)
+
+
+def extract_json_span(text: str) -> Optional[str]:
+    """
+    单遍扫描提取第一个配平的JSON对象或数组子串。
+    相比 re.search(r'\\{.*\\}', DOTALL)：线性时间、无回溯风险，
+    且能正确处理字符串内部出现的花括号。
+    """
+    if not isinstance(text, str):
+        return None
+
+    start = -1
+    depth = 0
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if start == -1:
+            if ch in "{[":
+                start = i
+                depth = 1
+            continue
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def parse_first_json(text: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
+    """提取并解析文本中第一个配平的JSON值，失败时返回None。"""
+    json_str = extract_json_span(text)
+    if json_str is None:
+        return None
+    try:
+        return loads(json_str)
+    except json.JSONDecodeError:
+        return None
+
+
+def extract_and_parse_json(text: str) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    从字符串中提取JSON对象或数组并进行解析。
+    能够处理JSON被包裹在Markdown代码块或被其他文本包围的情况。
+
+    Args:
+        text: 来自LLM的输入字符串。
+
+    Returns:
+        如果找到有效的JSON，则返回解析后的字典或列表，否则返回None。
+    """
+    if not isinstance(text, str):
+        return None
+
+    # 1. 尝试寻找被Markdown代码块包裹的JSON (e.g., ```json ... ```)
+    # 匹配对象 (e.g. {...}) 或数组 (e.g. [...])
+    match = _FENCE_RE.search(text)
+    if match:
+        json_str = match.group(1)
+        try:
+            return loads(json_str)
+        except json.JSONDecodeError:
+            # 如果解析失败，继续尝试其他方法
+            pass
+
+    # 2. 如果没有Markdown块，单遍扫描提取第一个配平的JSON对象/数组。
+    # 相比原先 '{'/'}' 和 '['/']' 各一轮 find/rfind（四次全文扫描，
+    # 且会把两个独立对象之间的散文误包进切片），一次线性扫描即可，
+    # 字符串内部的括号也能正确跳过
+    json_str = extract_json_span(text)
+    if json_str is not None:
+        try:
+            return loads(json_str)
+        except json.JSONDecodeError:
+            # 如果从提取的子字符串解析失败，继续
+            pass
+
+    # 3. 作为最后的手段，尝试直接解析整个字符串
+    try:
+        return loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    # 如果所有尝试都失败了，则返回None
+    print(f"警告: 无法从响应中解析JSON: {text[:500]}...")
     return None
\ No newline at end of file
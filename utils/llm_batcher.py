@@ -0,0 +1,77 @@
+# utils/llm_batcher.py
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+
+class LlmBatcher:
+    """
+    LLM请求合并器（coalescer）。
+    把短时间窗口内到达的多个请求攒成一批，再用一次 asyncio.gather
+    在共享连接池上并发发出，平滑突发流量并复用连接。
+    """
+
+    def __init__(self, max_batch: int = 8, linger_seconds: float = 0.01):
+        self.max_batch = max_batch
+        self.linger_seconds = linger_seconds
+        self._queue: List[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._first_enqueue_at: float = 0.0
+
+    async def submit(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        提交一个请求工厂（无参协程函数），返回其结果。
+        请求会被缓冲，直到攒满 max_batch 个或超过 linger 窗口才统一发出。
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        if not self._queue:
+            self._first_enqueue_at = time.monotonic()
+        self._queue.append((call, future))
+
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._linger_then_flush())
+
+        return await future
+
+    async def _linger_then_flush(self):
+        """等待 linger 窗口结束后冲刷队列"""
+        elapsed = time.monotonic() - self._first_enqueue_at
+        remaining = self.linger_seconds - elapsed
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        self._flush()
+
+    def _flush(self):
+        """把当前队列里的请求作为一批并发发出"""
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, []
+        asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]]):
+        results = await asyncio.gather(*(call() for call, _ in batch), return_exceptions=True)
+        for (_, future), result in zip(batch, results):
+            if future.cancelled():
+                continue
+            # gather也会把CancelledError（BaseException）捕获成结果对象，
+            # 按Exception判断会把它当响应塞进future返回给调用方
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# 进程级单例：所有Agent共享同一个合并器，跨Agent的并发请求才能攒到一批
+_LLM_BATCHER: Optional[LlmBatcher] = None
+
+
+def get_llm_batcher() -> LlmBatcher:
+    """获取进程级的请求合并器单例"""
+    global _LLM_BATCHER
+    if _LLM_BATCHER is None:
+        _LLM_BATCHER = LlmBatcher()
+    return _LLM_BATCHER
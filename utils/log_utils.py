@@ -0,0 +1,65 @@
+# utils/log_utils.py
+import atexit
+import logging
+import os
+import sys
+from logging.handlers import MemoryHandler
+
+from utils.json_utils import dump_json
+
+# 默认INFO：热路径上的大段JSON轨迹属于DEBUG级，平时不做序列化也不刷stdout；
+# 调试时设 METAAGENT_LOG_LEVEL=DEBUG 打开
+logging.basicConfig(level=os.environ.get("METAAGENT_LOG_LEVEL", "INFO").upper(),
+                    format="%(message)s")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """返回带项目前缀的logger"""
+    return logging.getLogger(f"metaagent.{name}")
+
+
+# 逐题进度输出共享同一个缓冲handler：记录先攒在内存里，
+# 攒满一批（或遇到WARNING及以上）才做一次write系统调用，
+# 高并发评估时不再每行进度各付一次阻塞的stdout写入
+_PROGRESS_HANDLER: MemoryHandler = None
+
+
+def _get_progress_handler() -> MemoryHandler:
+    global _PROGRESS_HANDLER
+    if _PROGRESS_HANDLER is None:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+        _PROGRESS_HANDLER = MemoryHandler(
+            capacity=32, flushLevel=logging.WARNING, target=stream_handler)
+        atexit.register(_PROGRESS_HANDLER.flush)
+    return _PROGRESS_HANDLER
+
+
+def get_progress_logger(name: str) -> logging.Logger:
+    """返回评估进度专用的缓冲logger，记录按批冲刷到stdout"""
+    logger = logging.getLogger(f"metaagent.progress.{name}")
+    handler = _get_progress_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+    return logger
+
+
+def flush_progress() -> None:
+    """立刻冲刷缓冲的进度记录（阶段结束、打印汇总前调用）"""
+    if _PROGRESS_HANDLER is not None:
+        _PROGRESS_HANDLER.flush()
+
+
+class LazyJson:
+    """
+    延迟序列化包装：只有当日志真正被消费时才执行pretty dump，
+    DEBUG关闭时完全不付序列化成本。
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return dump_json(self.obj, pretty=True)
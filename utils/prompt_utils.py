@@ -1,128 +1,257 @@
-# utils/prompt_utils.py
-import os
-from typing import Dict, Any
-
-_PROMPT_CACHE = {}
-
-def load_prompt_template(template_name: str) -> str:
-    """
-    加载提示模板
-    """
-    if template_name in _PROMPT_CACHE:
-        return _PROMPT_CACHE[template_name]
-    template = _DEFAULT_TEMPLATES.get(template_name, f"Template '{template_name}' not found.")
-    _PROMPT_CACHE[template_name] = template
-    return template
-
-# 默认模板 (已更新以支持新的进化机制)
-_DEFAULT_TEMPLATES = {
-    "meta_agent_system": """You are MetaAgent, a sophisticated AI coordinator that can generate and manage specialized AI agents to solve complex tasks. Your responsibilities include:
-1. Analyzing user tasks to determine the most effective approach.
-2. Creating specialized agents with tailored prompts for specific sub-tasks.
-3. Coordinating collaboration between multiple agents. Your system dynamically triggers refinement loops based on agent confidence, ensuring quality.
-4. Evaluating results and improving the system through self-evolution based on performance, agent confidence scores, and refinement trajectories.
-Your goal is to harness the collective intelligence of multiple specialized agents to achieve superior results.
-""",
-
-    "task_analysis": """Analyze the following task carefully and provide a structured assessment.
-
-TASK: {task_description}
-
-CRITICAL: Your response must be a single, valid JSON object. Do not add any text before or after the JSON.
-Provide your analysis in JSON format with the following fields:
-- task_type: The primary category (e.g., "code_generation", "high_complexity_math", "text_analysis").
-- complexity: A rating of task complexity ("low", "medium", "high").
-- key_requirements: A list of the most important requirements.
-- subtasks: A breakdown of the task into logical subtasks.
-- knowledge_domains: List of relevant knowledge domains.
-- potential_challenges: Anticipated difficulties.
-- suggested_approach: A high-level strategy.
-""",
-
-    "determine_agents": """Based on the following task analysis, determine the ideal set of specialized agents needed.
-
-TASK ANALYSIS: {task_analysis}
-
-For 'high' complexity tasks, you MUST include a 'reviewer' agent to enable self-correction loops. For simpler tasks, a 'planner' and 'executor' is often sufficient.
-
-CRITICAL: Return your response as a valid JSON array of agent specifications. The response must start with `[` and end with `]`.
-Each object must have these keys:
-- type: The agent's category (e.g., "planner", "executor", "hard_math_agent", "reviewer").
-- name: A descriptive name (e.g., "MathProofExecutor").
-- role: A concise description of this agent's role.
-- custom_prompt: A tailored system prompt for this agent.
-""",
-
-    "design_collaboration": """Design a collaboration workflow for the following agents to solve a task.
-
-TASK ANALYSIS: {task_analysis}
-AVAILABLE AGENTS: {agents}
-
-Create a step-by-step collaboration plan. Your plan should be logical, starting with planning and moving to execution. You DO NOT need to add a 'review' step, as the system will trigger it automatically if an agent's confidence is low.
-
-CRITICAL: Your response must be a single, valid JSON object. Do not add any text before or after the JSON.
-The JSON object must have these keys:
-- steps: An array of steps, each with:
-  - agent: The name of the agent responsible.
-  - action: What the agent should do (e.g., "plan", "execute", "code").
-  - input: Where the input comes from (e.g., "task_description", "previous_output").
-- final_output: Which step's output is the final result (usually "last_output").
-""",
-
-    "evaluate_result": """Evaluate the quality of the following result for the given task.
-
-TASK: {task_description}
-RESULT: {result}
-
-Provide a comprehensive evaluation.
-
-CRITICAL: Return your evaluation as a single, valid JSON object.
-The JSON object must have these keys:
-- score: A numeric rating from 0.0 (failure) to 1.0 (perfect).
-- strengths: An array of identified strengths.
-- weaknesses: An array of identified weaknesses.
-- improvement_suggestions: Specific suggestions for what could have been done better.
-""",
-
-    "identify_improvements": """Analyze the following task execution trajectory and identify areas for system improvement. The goal is to propose a single, high-impact change to an agent's core instructions (system prompt) to prevent similar failures or low-confidence outputs in the future.
-
-TASK ANALYSIS: {task_analysis}
-EXECUTION TRAJECTORY: {result_trajectory}
-FINAL EVALUATION: {evaluation}
-
-Focus on the steps with low confidence or where refinement was needed. What was the root cause of the agent's uncertainty or error? Based on this, suggest a specific improvement.
-
-CRITICAL: Return a valid JSON array containing a SINGLE improvement object.
-The object must have these keys:
-- type: Must be "agent_template".
-- specific_element_to_improve": The type of the agent that needs improvement (e.g., "hard_math_agent", "executor").
-- suggestions: An array of specific, actionable suggestions to add to the agent's system prompt to address the root cause. (e.g., "Add a directive to always double-check calculations before finalizing the answer.").
-""",
-
-    "improve_agent_template": """Improve the following agent template based on analysis of its performance.
-
-AGENT TYPE: {agent_type}
-CURRENT TEMPLATE: {current_template}
-PERFORMANCE CONTEXT: {context_info}
-IMPROVEMENT SUGGESTIONS: {suggestions}
-
-Your task is to rewrite the `system_prompt` for this agent. The new prompt must be a strict improvement. It should integrate the `suggestions` and address the failures or uncertainties described in the `context_info`. Make the agent's instructions more robust, precise, and better equipped to handle similar tasks in the future.
-
-CRITICAL: Return a single, valid JSON object representing the improved agent template, containing only the "system_prompt" key and its new, complete string value.
-""",
-
-    "synthesize_experiences": """You are a meta-analyst for an AI agent system. Analyze the following recent experiences (each including task type, agent trajectory with confidence scores, and final evaluation) to identify a systemic, recurring weakness.
-
-RECENT EXPERIENCES:
-{experiences_json}
-
-Your goal is to find a pattern. For instance, does the 'hard_math_agent' consistently express low confidence on algebra problems? Does the 'executor' agent often fail to follow complex plans? Based on the most critical recurring pattern, propose a single, high-impact evolution for the responsible agent's template.
-
-CRITICAL: Return a valid JSON array containing a SINGLE improvement plan object.
-The object must have these keys:
-- type: Must be "agent_template".
-- specific_element_to_improve": The agent type that needs the most critical update (e.g., "hard_math_agent").
-- reasoning": A brief explanation of the systemic weakness you identified from the data.
-- suggestions": An array of concrete suggestions for improving its system prompt to fix this systemic issue.
-"""
-}
\ No newline at end of file
+# utils/prompt_utils.py
+import functools
+import mmap
+import os
+import pickle
+import string
+import sys
+import types
+from typing import Dict, Any, Optional
+
+# 模板文件目录：prompts/<template_name>.txt
+_PROMPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "prompts")
+# 预冻结的模板包（python -m utils.prompt_utils --freeze 生成）：
+# 冷启动时一次read+unpickle拿到全表，比逐文件打开或编译多KB字面量都快
+_PICKLE_PATH = os.path.join(_PROMPT_DIR, "prompts.pkl")
+
+
+def _load_pickled_templates() -> Dict[str, str]:
+    try:
+        with open(_PICKLE_PATH, "rb") as f:
+            data = pickle.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+
+_PICKLED_TEMPLATES = _load_pickled_templates()
+
+# 模板间共享的样板片段：拼接发生在模块加载时，每个唯一片段只占
+# 一份驻留内存，而不是在每个模板里各存一份字面量
+_JSON_OBJ_RULE = "CRITICAL: Your response must be a single, valid JSON object. Do not add any text before or after the JSON.\n"
+_JSON_OBJ_KEYS = "The JSON object must have these keys:\n"
+_OBJ_KEYS = "The object must have these keys:\n"
+_AGENT_TEMPLATE_TYPE = '- type: Must be "agent_template".\n'
+
+# 默认模板 (已更新以支持新的进化机制)
+_DEFAULT_TEMPLATES = {
+    "meta_agent_system": """You are MetaAgent, a sophisticated AI coordinator that can generate and manage specialized AI agents to solve complex tasks. Your responsibilities include:
+1. Analyzing user tasks to determine the most effective approach.
+2. Creating specialized agents with tailored prompts for specific sub-tasks.
+3. Coordinating collaboration between multiple agents. Your system dynamically triggers refinement loops based on agent confidence, ensuring quality.
+4. Evaluating results and improving the system through self-evolution based on performance, agent confidence scores, and refinement trajectories.
+Your goal is to harness the collective intelligence of multiple specialized agents to achieve superior results.
+""",
+
+    "task_analysis": """Analyze the following task carefully and provide a structured assessment.
+
+TASK: {task_description}
+
+""" + _JSON_OBJ_RULE + """Provide your analysis in JSON format with the following fields:
+- task_type: The primary category (e.g., "code_generation", "high_complexity_math", "text_analysis").
+- complexity: A rating of task complexity ("low", "medium", "high").
+- key_requirements: A list of the most important requirements.
+- subtasks: A breakdown of the task into logical subtasks.
+- knowledge_domains: List of relevant knowledge domains.
+- potential_challenges: Anticipated difficulties.
+- suggested_approach: A high-level strategy.
+""",
+
+    "determine_agents": """Based on the following task analysis, determine the ideal set of specialized agents needed.
+
+TASK ANALYSIS: {task_analysis}
+
+For 'high' complexity tasks, you MUST include a 'reviewer' agent to enable self-correction loops. For simpler tasks, a 'planner' and 'executor' is often sufficient.
+
+CRITICAL: Return your response as a valid JSON array of agent specifications. The response must start with `[` and end with `]`.
+Each object must have these keys:
+- type: The agent's category (e.g., "planner", "executor", "hard_math_agent", "reviewer").
+- name: A descriptive name (e.g., "MathProofExecutor").
+- role: A concise description of this agent's role.
+- custom_prompt: A tailored system prompt for this agent.
+""",
+
+    "design_collaboration": """Design a collaboration workflow for the following agents to solve a task.
+
+TASK ANALYSIS: {task_analysis}
+AVAILABLE AGENTS: {agents}
+
+Create a step-by-step collaboration plan. Your plan should be logical, starting with planning and moving to execution. You DO NOT need to add a 'review' step, as the system will trigger it automatically if an agent's confidence is low.
+
+""" + _JSON_OBJ_RULE + _JSON_OBJ_KEYS + """- steps: An array of steps, each with:
+  - agent: The name of the agent responsible.
+  - action: What the agent should do (e.g., "plan", "execute", "code").
+  - input: Where the input comes from (e.g., "task_description", "previous_output").
+- final_output: Which step's output is the final result (usually "last_output").
+""",
+
+    "evaluate_result": """Evaluate the quality of the following result for the given task.
+
+TASK: {task_description}
+RESULT: {result}
+
+Provide a comprehensive evaluation.
+
+CRITICAL: Return your evaluation as a single, valid JSON object.
+""" + _JSON_OBJ_KEYS + """- score: A numeric rating from 0.0 (failure) to 1.0 (perfect).
+- strengths: An array of identified strengths.
+- weaknesses: An array of identified weaknesses.
+- improvement_suggestions: Specific suggestions for what could have been done better.
+""",
+
+    "identify_improvements": """Analyze the following task execution trajectory and identify areas for system improvement. The goal is to propose a single, high-impact change to an agent's core instructions (system prompt) to prevent similar failures or low-confidence outputs in the future.
+
+TASK ANALYSIS: {task_analysis}
+EXECUTION TRAJECTORY: {result_trajectory}
+FINAL EVALUATION: {evaluation}
+
+Focus on the steps with low confidence or where refinement was needed. What was the root cause of the agent's uncertainty or error? Based on this, suggest a specific improvement.
+
+CRITICAL: Return a valid JSON array containing a SINGLE improvement object.
+""" + _OBJ_KEYS + _AGENT_TEMPLATE_TYPE + """- specific_element_to_improve: The type of the agent that needs improvement (e.g., "hard_math_agent", "executor").
+- suggestions: An array of specific, actionable suggestions to add to the agent's system prompt to address the root cause. (e.g., "Add a directive to always double-check calculations before finalizing the answer.").
+""",
+
+    "improve_agent_template": """Improve the following agent template based on analysis of its performance.
+
+AGENT TYPE: {agent_type}
+CURRENT TEMPLATE: {current_template}
+PERFORMANCE CONTEXT: {context_info}
+IMPROVEMENT SUGGESTIONS: {suggestions}
+
+Your task is to rewrite the `system_prompt` for this agent. The new prompt must be a strict improvement. It should integrate the `suggestions` and address the failures or uncertainties described in the `context_info`. Make the agent's instructions more robust, precise, and better equipped to handle similar tasks in the future.
+
+CRITICAL: Return a single, valid JSON object representing the improved agent template, containing only the "system_prompt" key and its new, complete string value.
+""",
+
+    "improve_agent_templates_batch": """Improve the following agent templates based on analysis of their performance.
+
+IMPROVEMENT AREAS: {areas_json}
+PERFORMANCE CONTEXT: {context_info}
+
+For EACH improvement area, rewrite that agent's `system_prompt`. Each new prompt must be a strict improvement: integrate the area's `suggestions` and address the failures described in the performance context. Make the instructions more robust, precise, and better equipped to handle similar tasks in the future.
+
+CRITICAL: Return a single, valid JSON array with exactly one object per improvement area. Each object must have these keys:
+- agent_type: The agent type being improved (copied from the area).
+- improved_template: An object containing only the "system_prompt" key and its new, complete string value.
+""",
+
+    "synthesize_experiences": """You are a meta-analyst for an AI agent system. Analyze the following recent experiences (each including task type, agent trajectory with confidence scores, and final evaluation) to identify a systemic, recurring weakness.
+
+RECENT EXPERIENCES:
+{experiences_json}
+
+Your goal is to find a pattern. For instance, does the 'hard_math_agent' consistently express low confidence on algebra problems? Does the 'executor' agent often fail to follow complex plans? Based on the most critical recurring pattern, propose a single, high-impact evolution for the responsible agent's template.
+
+CRITICAL: Return a valid JSON array containing a SINGLE improvement plan object.
+""" + _OBJ_KEYS + _AGENT_TEMPLATE_TYPE + """- specific_element_to_improve: The agent type that needs the most critical update (e.g., "hard_math_agent").
+- reasoning: A brief explanation of the systemic weakness you identified from the data.
+- suggestions: An array of concrete suggestions for improving its system prompt to fix this systemic issue.
+"""
+}
+
+# 模板表只读：键intern后，调用方用相同字面量查表可走驻留字符串的
+# 恒等快路径（跳过逐字符比较）；MappingProxyType防止外部代码误改表
+_DEFAULT_TEMPLATES = types.MappingProxyType(
+    {sys.intern(k): v for k, v in _DEFAULT_TEMPLATES.items()})
+
+if __debug__:
+    # 导入时自检：占位符字段名里不应混入引号（模板里出现过 `foo":` 笔误），
+    # 否则预解析渲染会把它当成永远缺参的格式字段
+    for _name, _tpl in _DEFAULT_TEMPLATES.items():
+        for _, _field, _, _ in string.Formatter().parse(_tpl):
+            assert _field is None or '"' not in _field, (_name, _field)
+    del _name, _tpl, _field
+
+
+@functools.lru_cache(maxsize=None)
+def _load_template_file(template_name: str) -> Optional[str]:
+    """
+    从 prompts/<name>.txt 惰性加载模板，首次读取后由lru_cache常驻。
+    mmap只映射真正被读的页；文件缺失或为空时返回None走内置回退。
+    """
+    path = os.path.join(_PROMPT_DIR, f"{template_name}.txt")
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:].decode("utf-8")
+    except (OSError, ValueError):
+        return None
+
+
+def _lookup_template(template_name: str) -> Optional[str]:
+    """模板解析顺序：冻结包 > prompts/目录文件 > 内置模板表"""
+    template = _PICKLED_TEMPLATES.get(template_name)
+    if template is not None:
+        return template
+    template = _load_template_file(template_name)
+    if template is not None:
+        return template
+    return _DEFAULT_TEMPLATES.get(template_name)
+
+
+def load_prompt_template(template_name: str) -> str:
+    """
+    加载提示模板。
+    优先用预冻结的模板包，其次按需读取 prompts/ 下的模板文件
+    （只加载用到的模板），最后回退到内置模板表。
+    """
+    return _lookup_template(template_name) or f"Template '{template_name}' not found."
+
+
+# 模板首次渲染时用string.Formatter解析一次为(literal, field, spec, conv)
+# 片段序列并缓存；此后渲染只遍历已token化的元组并join，
+# 不再逐次解析{placeholder}语法
+_FORMATTER = string.Formatter()
+_PARSED_TEMPLATES: Dict[str, tuple] = {}
+
+
+def render_prompt(template_name: str, **kwargs: Any) -> str:
+    """
+    按预解析的片段渲染模板，等价于 load_prompt_template(name).format(**kwargs)。
+    与str.format一致：多余的关键字被忽略，缺少的占位符抛KeyError。
+    未知模板名回退到load+format路径（保持"Template not found"行为）。
+    """
+    parsed = _PARSED_TEMPLATES.get(template_name)
+    if parsed is None:
+        template = _lookup_template(template_name)
+        if template is None:
+            return load_prompt_template(template_name).format(**kwargs)
+        parsed = tuple(_FORMATTER.parse(template))
+        _PARSED_TEMPLATES[template_name] = parsed
+    parts = []
+    for literal, field, _spec, _conv in parsed:
+        if literal:
+            parts.append(literal)
+        if field is not None:
+            parts.append(str(kwargs[field]))
+    return "".join(parts)
+
+
+def __getattr__(name: str) -> str:
+    """
+    PEP 562模块级属性访问：`prompt_utils.task_analysis` 直接取模板，
+    纯读路径，没有缓存写分支。动态模板名仍用 load_prompt_template。
+    """
+    template = _lookup_template(name)
+    if template is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return template
+
+
+def _freeze_templates() -> None:
+    """把当前全部模板（文件优先）打包写入 prompts.pkl，protocol 5"""
+    merged = dict(_DEFAULT_TEMPLATES)
+    for name in merged:
+        from_file = _load_template_file(name)
+        if from_file is not None:
+            merged[name] = from_file
+    with open(_PICKLE_PATH, "wb") as f:
+        pickle.dump(merged, f, protocol=5)
+    print(f"Froze {len(merged)} templates to {_PICKLE_PATH}")
+
+
+if __name__ == "__main__":
+    if "--freeze" in sys.argv:
+        _freeze_templates()
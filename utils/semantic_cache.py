@@ -0,0 +1,121 @@
+# utils/semantic_cache.py
+import atexit
+import os
+import pickle
+from typing import Any, Dict, Optional
+
+# 语义缓存依赖可选的本地嵌入与向量检索库。
+# 缺少依赖时缓存自动降级为禁用，不影响主流程。
+try:
+    import numpy as np
+    import faiss
+    from sentence_transformers import SentenceTransformer
+    _DEPS_AVAILABLE = True
+except ImportError:
+    _DEPS_AVAILABLE = False
+
+
+class SemanticCache:
+    """
+    基于嵌入相似度的响应缓存。
+    对于措辞不同但语义相近的prompt（例如修正循环中反复出现的
+    "Review..." / "Improve..." 变体），精确哈希缓存会全部失效，
+    而余弦相似度足够高时可以直接复用之前的响应。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or {}
+        self.threshold = self.config.get("semantic_cache_threshold", 0.92)
+        self.index_path = self.config.get("semantic_cache_index_path",
+                                          os.path.join("results", "semantic_cache.index"))
+        # 响应文本与索引同目录落盘：索引的第i个向量对应列表第i条响应，
+        # 两个文件必须成对保存/恢复，否则索引命中也取不回文本
+        self._responses_path = self.index_path + ".responses.pkl"
+        self._persist_every = self.config.get("semantic_cache_persist_every", 32)
+        self._dirty_writes = 0
+        self.enabled = bool(self.config.get("semantic_cache_enabled", False)) and _DEPS_AVAILABLE
+
+        self._model = None
+        self._index = None
+        self._responses = []
+        if self.enabled:
+            # 退出前把未满持久化阈值的尾部写入也落盘
+            atexit.register(self.save)
+
+    def _ensure_loaded(self):
+        """惰性加载嵌入模型与FAISS索引，避免未启用时的启动开销。"""
+        if self._model is None:
+            self._model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+            self._index = self._load_index()
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(self._model.get_sentence_embedding_dimension())
+                self._responses = []
+
+    def _load_index(self):
+        """尝试恢复上次运行落盘的索引与响应列表；任一文件缺失或不一致时放弃"""
+        if not (os.path.exists(self.index_path) and os.path.exists(self._responses_path)):
+            return None
+        try:
+            index = faiss.read_index(self.index_path)
+            with open(self._responses_path, "rb") as f:
+                responses = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, RuntimeError):
+            return None
+        # 向量数与响应数必须对得上，否则检索结果会错位
+        if not isinstance(responses, list) or index.ntotal != len(responses):
+            return None
+        self._responses = responses
+        return index
+
+    def _embed(self, text: str):
+        vec = self._model.encode([text], normalize_embeddings=True)
+        return np.asarray(vec, dtype="float32")
+
+    def lookup(self, prompt: str) -> Optional[str]:
+        """检索语义最接近的缓存响应，相似度达到阈值时返回，否则返回None。"""
+        if not self.enabled:
+            return None
+        self._ensure_loaded()
+        if self._index.ntotal == 0:
+            return None
+
+        scores, indices = self._index.search(self._embed(prompt), 1)
+        if scores[0][0] >= self.threshold:
+            return self._responses[indices[0][0]]
+        return None
+
+    def store(self, prompt: str, response: str) -> None:
+        """将新的 (prompt, response) 对加入缓存，每隔若干次写入落一次盘。"""
+        if not self.enabled:
+            return
+        self._ensure_loaded()
+        self._index.add(self._embed(prompt))
+        self._responses.append(response)
+        self._dirty_writes += 1
+        if self._dirty_writes >= self._persist_every:
+            self.save()
+
+    def save(self) -> None:
+        """把索引和响应列表成对落盘；失败时静默跳过，缓存只是加速手段。"""
+        if not self.enabled or self._index is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            faiss.write_index(self._index, self.index_path)
+            with open(self._responses_path, "wb") as f:
+                pickle.dump(self._responses, f)
+            self._dirty_writes = 0
+        except OSError:
+            pass
+
+
+# 进程级单例：所有Agent共享同一份语义缓存
+_SEMANTIC_CACHE: Optional[SemanticCache] = None
+
+
+def get_semantic_cache(config: Optional[Dict[str, Any]] = None) -> SemanticCache:
+    """获取进程级的语义缓存单例"""
+    global _SEMANTIC_CACHE
+    if _SEMANTIC_CACHE is None:
+        _SEMANTIC_CACHE = SemanticCache(config)
+    return _SEMANTIC_CACHE